@@ -0,0 +1,147 @@
+import os
+import math
+import time
+import threading
+from functools import wraps
+from flask import request, jsonify, make_response
+import metrics
+
+RATE_LIMIT_PER_MINUTE = float(os.environ.get('TTS_RATE_LIMIT_PER_MIN', 60))
+RATE_LIMIT_BURST = float(os.environ.get('TTS_RATE_LIMIT_BURST', 20))
+MAX_IN_FLIGHT = int(os.environ.get('TTS_MAX_INFLIGHT', 16))
+MAX_QUEUE = int(os.environ.get('TTS_MAX_QUEUE', 32))
+QUEUE_TIMEOUT = float(os.environ.get('TTS_QUEUE_TIMEOUT', 10))
+TRUST_PROXY = os.environ.get('TTS_TRUST_PROXY', 'False').lower() == 'true'
+
+ADMISSION_REJECTED = metrics.registry.register(metrics.Counter(
+    'tts_admission_rejected_total', 'Peticiones rechazadas por control de admisión', ('reason',)))
+ADMISSION_QUEUED = metrics.registry.register(metrics.Gauge(
+    'tts_admission_queue_depth', 'Peticiones esperando un hueco de síntesis'))
+
+class RateLimited(Exception):
+    """Petición rechazada; retry_after indica los segundos sugeridos de espera"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+class TokenBucketLimiter:
+    """Limitador de tasa por cliente con cubetas de tokens"""
+
+    def __init__(self, rate_per_minute=RATE_LIMIT_PER_MINUTE, burst=RATE_LIMIT_BURST, idle_ttl=600):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.idle_ttl = idle_ttl
+        self._buckets = {}  # cliente -> [tokens, última actualización]
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+
+    def consume(self, client, cost=1):
+        """Descontar cost tokens del cliente o lanzar RateLimited"""
+        cost = min(cost, self.burst)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < cost:
+                self._buckets[client] = [tokens, now]
+                raise RateLimited("Límite de solicitudes excedido", (cost - tokens) / self.rate)
+            self._buckets[client] = [tokens - cost, now]
+            self._prune(now)
+
+    def _prune(self, now):
+        # Las cubetas inactivas ya estarían llenas: se pueden descartar
+        if now - self._last_prune < self.idle_ttl:
+            return
+        self._last_prune = now
+        for client in [c for c, (_, updated) in self._buckets.items() if now - updated > self.idle_ttl]:
+            del self._buckets[client]
+
+class AdmissionController:
+    """Límite global de síntesis simultáneas con una cola de espera acotada"""
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, max_queue=MAX_QUEUE, timeout=QUEUE_TIMEOUT):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._in_flight = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            if self._in_flight < self.max_in_flight:
+                self._in_flight += 1
+                return
+            if self._waiting >= self.max_queue:
+                raise RateLimited("Servicio saturado, intente más tarde", self.timeout)
+            self._waiting += 1
+            ADMISSION_QUEUED.set(self._waiting)
+            try:
+                deadline = time.monotonic() + self.timeout
+                while self._in_flight >= self.max_in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise RateLimited("Tiempo de espera agotado en la cola", self.timeout)
+                    self._cond.wait(remaining)
+                self._in_flight += 1
+            finally:
+                self._waiting -= 1
+                ADMISSION_QUEUED.set(self._waiting)
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+rate_limiter = TokenBucketLimiter()
+admission = AdmissionController()
+
+def client_id():
+    """Identificar al cliente por su IP (o la primera de X-Forwarded-For tras un proxy)"""
+    if TRUST_PROXY and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr or 'unknown'
+
+def _too_many_requests(error, reason):
+    ADMISSION_REJECTED.inc(reason=reason)
+    response = jsonify({"error": str(error), "retry_after": error.retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def admission_required(cost=lambda: 1, limit_concurrency=True):
+    """Aplicar límite de tasa por cliente y, opcionalmente, el límite global de síntesis
+
+    cost es una función evaluada dentro de la petición (p. ej. número de textos
+    de un lote). En las respuestas en streaming el hueco se libera al cerrar
+    la respuesta, cuando termina la síntesis.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                rate_limiter.consume(client_id(), cost())
+            except RateLimited as e:
+                return _too_many_requests(e, 'rate_limit')
+            if not limit_concurrency:
+                return view(*args, **kwargs)
+
+            try:
+                admission.acquire()
+            except RateLimited as e:
+                return _too_many_requests(e, 'overload')
+            try:
+                response = view(*args, **kwargs)
+            except BaseException:
+                admission.release()
+                raise
+            response = make_response(response)
+            if response.content_length is None:
+                # Cuerpo generado en streaming: la síntesis continúa mientras se envía
+                response.call_on_close(admission.release)
+            else:
+                admission.release()
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,229 @@
+import os
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+import db
+from storage import atomic_write
+
+# Presupuesto por defecto de la caché en disco (200 MB)
+DEFAULT_MAX_BYTES = int(os.environ.get('TTS_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+# Segundos entre actualizaciones del último uso de una entrada (precisión del LRU)
+TOUCH_INTERVAL = int(os.environ.get('TTS_CACHE_TOUCH_INTERVAL', 60))
+
+def normalize_text(text):
+    """Normalizar texto para que variaciones triviales compartan entrada"""
+    text = unicodedata.normalize('NFC', text)
+    return ' '.join(text.split())
+
+def make_key(text, lang, slow, *extra):
+    """Calcular la clave de caché a partir del texto normalizado y los parámetros"""
+    parts = [normalize_text(text), lang, '1' if slow else '0']
+    parts.extend(str(e) for e in extra)
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+_digests = OrderedDict()  # ruta -> (tamaño, mtime_ns, sha256)
+_digests_lock = threading.Lock()
+_MAX_DIGESTS = 4096
+
+def file_digest(path, chunk_size=64 * 1024):
+    """SHA-256 del contenido de un archivo, recordado mientras no cambie tamaño ni mtime"""
+    stat = os.stat(path)
+    with _digests_lock:
+        cached = _digests.get(path)
+        if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            _digests.move_to_end(path)
+            return cached[2]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    value = digest.hexdigest()
+
+    with _digests_lock:
+        _digests[path] = (stat.st_size, stat.st_mtime_ns, value)
+        _digests.move_to_end(path)
+        while len(_digests) > _MAX_DIGESTS:
+            _digests.popitem(last=False)
+    return value
+
+class AudioCache:
+    """Caché persistente en disco direccionada por contenido con expulsión LRU
+
+    El índice (tamaño y último uso de cada entrada) vive en un SQLite dentro
+    de la propia carpeta, de modo que todos los procesos que la comparten
+    (varios trabajadores de gunicorn, Streamlit) ven las mismas entradas y
+    respetan un único presupuesto. El tamaño total lo mantienen triggers y el
+    último uso solo se reescribe cada TOUCH_INTERVAL segundos para no
+    convertir cada acierto en una escritura. El índice se abre con el primer
+    uso, no al construir la caché.
+    """
+
+    INDEX_NAME = 'index.db'
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, suffix='.mp3'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.index_path = os.path.join(directory, self.INDEX_NAME)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _conn(self):
+        if not self._ready:
+            self._open()
+        return db.get_connection(self.index_path)
+
+    def _open(self):
+        with self._lock:
+            if self._ready:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self._init_index()
+            self._ready = True
+        self._load()
+
+    def _init_index(self):
+        conn = db.get_connection(self.index_path)
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    key TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_entries_last_used ON cache_entries (last_used)')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_totals (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL)')
+            conn.execute('INSERT OR IGNORE INTO cache_totals (id, size) VALUES (0, 0)')
+            conn.executescript('''
+                CREATE TRIGGER IF NOT EXISTS cache_entries_ai AFTER INSERT ON cache_entries BEGIN
+                    UPDATE cache_totals SET size = size + new.size WHERE id = 0;
+                END;
+                CREATE TRIGGER IF NOT EXISTS cache_entries_ad AFTER DELETE ON cache_entries BEGIN
+                    UPDATE cache_totals SET size = size - old.size WHERE id = 0;
+                END;
+                CREATE TRIGGER IF NOT EXISTS cache_entries_au AFTER UPDATE OF size ON cache_entries BEGIN
+                    UPDATE cache_totals SET size = size + new.size - old.size WHERE id = 0;
+                END;
+            ''')
+
+    def _load(self):
+        """Indexar los archivos existentes si el índice está vacío (primer arranque)"""
+        conn = self._conn()
+        if conn.execute('SELECT 1 FROM cache_entries LIMIT 1').fetchone():
+            return
+        found = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(self.suffix):
+                    stat = entry.stat()
+                    found.append((entry.name[:-len(self.suffix)], stat.st_size, stat.st_mtime))
+        if found:
+            with conn:
+                conn.executemany('INSERT OR IGNORE INTO cache_entries (key, size, last_used) VALUES (?, ?, ?)', found)
+            self._evict()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        """Devolver la ruta del archivo en caché o None si no existe"""
+        conn = self._conn()
+        row = conn.execute('SELECT last_used FROM cache_entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self._count(False)
+            return None
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            # El archivo desapareció por fuera de la caché
+            with conn:
+                conn.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+            self._count(False)
+            return None
+        now = time.time()
+        if now - row[0] > TOUCH_INTERVAL:
+            with conn:
+                conn.execute('UPDATE cache_entries SET last_used = ? WHERE key = ?', (now, key))
+        self._count(True)
+        return path
+
+    def get_bytes(self, key):
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, key, data):
+        """Guardar datos en la caché de forma atómica y devolver su ruta"""
+        path = atomic_write(self.path_for(key), data)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                'INSERT INTO cache_entries (key, size, last_used) VALUES (?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET size = excluded.size, last_used = excluded.last_used',
+                (key, len(data), time.time())
+            )
+        self._evict()
+        return path
+
+    def _size(self):
+        return self._conn().execute('SELECT size FROM cache_totals WHERE id = 0').fetchone()[0]
+
+    def _evict(self):
+        """Eliminar las entradas menos usadas hasta respetar el presupuesto"""
+        if self._size() <= self.max_bytes:
+            return
+        conn = self._conn()
+        # BEGIN IMMEDIATE: un solo proceso elige y borra las víctimas a la vez
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            total = self._size()
+            victims = []
+            # Siempre se conserva la entrada más reciente
+            keep = conn.execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0] - 1
+            for key, size in conn.execute('SELECT key, size FROM cache_entries ORDER BY last_used'):
+                if total <= self.max_bytes or len(victims) >= keep:
+                    break
+                victims.append((key,))
+                total -= size
+            conn.executemany('DELETE FROM cache_entries WHERE key = ?', victims)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        for (key,) in victims:
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        entries, size = self._conn().execute(
+            'SELECT (SELECT COUNT(*) FROM cache_entries), (SELECT size FROM cache_totals WHERE id = 0)'
+        ).fetchone()
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+                'entries': entries,
+                'size_bytes': size,
+                'max_bytes': self.max_bytes
+            }
@@ -0,0 +1,63 @@
+"""Sustituto local y determinista de gTTS para los benchmarks"""
+import time
+import hashlib
+
+# Trama MPEG-2 Layer III, 24 kHz, 32 kbps, mono (96 bytes, ~24 ms de audio)
+FRAME_HEADER = bytes([0xFF, 0xF3, 0x44, 0xC4])
+FRAME_SIZE = 96
+
+class FakeGTTS:
+    """Imita la interfaz de gTTS (save, write_to_fp, stream) sin red
+
+    La latencia simula el viaje de ida y vuelta al servicio remoto y el
+    tamaño del MP3 es proporcional al texto, como en la respuesta real.
+    """
+
+    latency = 0.05            # segundos por petición
+    latency_per_char = 0.0    # segundos adicionales por carácter
+    bytes_per_char = 200      # tamaño aproximado del MP3 por carácter
+    chunk_chars = 100         # gTTS divide el texto en fragmentos de ~100 caracteres
+    calls = 0
+
+    def __init__(self, text, lang='es', slow=False, **kwargs):
+        self.text = text
+        self.lang = lang
+        self.slow = slow
+
+    @classmethod
+    def configure(cls, latency=None, latency_per_char=None, bytes_per_char=None):
+        if latency is not None:
+            cls.latency = latency
+        if latency_per_char is not None:
+            cls.latency_per_char = latency_per_char
+        if bytes_per_char is not None:
+            cls.bytes_per_char = bytes_per_char
+        cls.calls = 0
+
+    def _frames(self, part):
+        """Generar tramas MP3 válidas cuyo contenido depende del texto"""
+        seed = hashlib.sha256(f"{self.lang}|{self.slow}|{part}".encode('utf-8')).digest()
+        body = (seed * (FRAME_SIZE // len(seed) + 1))[:FRAME_SIZE - len(FRAME_HEADER)]
+        count = max(1, len(part) * self.bytes_per_char // FRAME_SIZE)
+        return (FRAME_HEADER + body) * count
+
+    def stream(self):
+        type(self).calls += 1
+        parts = [self.text[i:i + self.chunk_chars] for i in range(0, len(self.text), self.chunk_chars)]
+        for part in parts or ['']:
+            time.sleep(self.latency + self.latency_per_char * len(part))
+            yield self._frames(part)
+
+    def write_to_fp(self, fp):
+        for chunk in self.stream():
+            fp.write(chunk)
+
+    def save(self, savefile):
+        with open(str(savefile), 'wb') as f:
+            self.write_to_fp(f)
+
+class FakeUpstreamClient:
+    """Cliente para engines.GTTSEngine que sintetiza con FakeGTTS sin red"""
+
+    def stream(self, text, lang, slow=False):
+        return FakeGTTS(text, lang, slow).stream()
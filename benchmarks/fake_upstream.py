@@ -0,0 +1,143 @@
+"""Doble HTTP local del endpoint de gTTS (batchexecute) para benchmarks y pruebas manuales
+
+Responde con el mismo formato que el servicio real, de modo que el cliente de
+upstream.py se ejerce completo: pool de conexiones, reintentos y cortocircuito.
+
+Uso:
+    python -m benchmarks.fake_upstream --port 8765 --fail-rate 0.2
+    TTS_UPSTREAM_URL=http://127.0.0.1:8765 python main_flask.py
+"""
+import json
+import time
+import base64
+import random
+import argparse
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from benchmarks.fake_gtts import FakeGTTS
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, como el servicio real
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        server.record_request(self.client_address)
+
+        status = server.next_status()
+        if status == 'truncate':
+            # Cuerpo más corto que el Content-Length anunciado y conexión cerrada
+            self.send_response(200)
+            self.send_header('Content-Length', '1024')
+            self.end_headers()
+            self.wfile.write(b")]}'")
+            self.close_connection = True
+            return
+        if 300 <= status < 400:
+            # Redirección a la misma URL: en bucle mientras dure el fallo
+            self.send_response(status)
+            self.send_header('Location', self.path)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if status != 200:
+            self._reply(status, b'error')
+            return
+
+        try:
+            rpc = json.loads(urllib.parse.parse_qs(body)['f.req'][0])
+            text, lang, speed = json.loads(rpc[0][0][1])[:3]
+        except (KeyError, IndexError, ValueError):
+            self._reply(400, b'bad request')
+            return
+
+        time.sleep(FakeGTTS.latency + FakeGTTS.latency_per_char * len(text))
+        audio = FakeGTTS(text, lang, slow=speed is True)._frames(text)
+        payload = base64.b64encode(audio).decode('ascii')
+        line = '[["wrb.fr","jQ1olc","[\\"' + payload + '\\"]",null,null,null,"generic"]]'
+        self._reply(200, (")]}'\n\n" + str(len(line)) + "\n" + line + "\n").encode('utf-8'))
+
+    def _reply(self, status, data):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class FakeUpstreamServer(ThreadingHTTPServer):
+    """Servidor con inyección de fallos (tasa aleatoria o los próximos N)
+
+    Un fallo es un código HTTP (los 3xx redirigen a la misma URL) o
+    'truncate', que corta el cuerpo de la respuesta.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, fail_rate=0.0, fail_status=503):
+        super().__init__((host, port), _Handler)
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.requests = 0
+        self.connections = set()
+        self._fail_next = 0
+        self._fail_next_status = fail_status
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fail_next(self, count, status=None):
+        """Hacer fallar las próximas count peticiones (con fail_status por defecto)"""
+        with self._lock:
+            self._fail_next = count
+            self._fail_next_status = status or self.fail_status
+
+    def record_request(self, client_address):
+        with self._lock:
+            self.requests += 1
+            self.connections.add(client_address)
+
+    def next_status(self):
+        with self._lock:
+            if self._fail_next > 0:
+                self._fail_next -= 1
+                return self._fail_next_status
+        if self.fail_rate and random.random() < self.fail_rate:
+            return self.fail_status
+        return 200
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True, name='fake-upstream')
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Doble HTTP local del servicio TTS')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Proporción de respuestas 503')
+    args = parser.parse_args(argv)
+
+    FakeGTTS.configure(latency=args.latency_ms / 1000)
+    server = FakeUpstreamServer(port=args.port, fail_rate=args.fail_rate)
+    print(f"🎭 Doble de TTS escuchando en {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Presupuesto de arranque de la API: tiempo de create_app() en un proceso nuevo
+
+Cada medición lanza un intérprete limpio que importa main_flask y crea la
+aplicación en modo testing (sin hilos en segundo plano), con base de datos y
+caché aisladas. Falla si la mediana supera el presupuesto o si al arrancar se
+cargan dependencias que solo necesitan algunas rutas.
+
+Uso:
+    python -m benchmarks.import_budget
+    python -m benchmarks.import_budget --budget-ms 250 --runs 7
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Se importan bajo demanda en la primera ruta que las usa
+LAZY_MODULES = ('numpy', 'pydub', 'gtts', 'requests')
+
+_PROBE = f"""
+import sys, time, json
+start = time.perf_counter()
+import main_flask
+imported = time.perf_counter()
+main_flask.create_app('testing')
+created = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'loaded': [m for m in {LAZY_MODULES!r} if m in sys.modules]
+}}))
+"""
+
+def measure_boot(workdir=None):
+    """Arrancar la aplicación en un proceso nuevo y devolver sus tiempos"""
+    own_workdir = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix='tts_boot_')
+    env = dict(os.environ,
+               TTS_DB_PATH=os.path.join(workdir, 'boot.db'),
+               TTS_CACHE_DIR=os.path.join(workdir, 'cache'))
+    try:
+        output = subprocess.run([sys.executable, '-c', _PROBE], cwd=ROOT, env=env,
+                                capture_output=True, text=True, check=True).stdout
+    finally:
+        if own_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    result = json.loads(output.strip().splitlines()[-1])
+    result['total_ms'] = result['import_ms'] + result['create_app_ms']
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Presupuesto de arranque de la API Flask')
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('TTS_BOOT_BUDGET_MS', 300)),
+                        help='Mediana máxima de import + create_app()')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    runs = [measure_boot() for _ in range(args.runs)]
+    median = statistics.median(r['total_ms'] for r in runs)
+    loaded = sorted({m for r in runs for m in r['loaded']})
+    print(f"⏱️  arranque: mediana={median:.1f}ms "
+          f"(import={statistics.median(r['import_ms'] for r in runs):.1f}ms, "
+          f"create_app={statistics.median(r['create_app_ms'] for r in runs):.1f}ms) "
+          f"presupuesto={args.budget_ms:.0f}ms")
+
+    failed = False
+    if loaded:
+        print(f"❌ Dependencias cargadas al arrancar: {', '.join(loaded)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"❌ Arranque por encima del presupuesto ({median:.1f}ms > {args.budget_ms:.0f}ms)")
+        failed = True
+    if not failed:
+        print("✅ Arranque dentro del presupuesto")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
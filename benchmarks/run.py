@@ -0,0 +1,319 @@
+"""Suite de benchmarks en proceso para la API Flask y las funciones de Streamlit
+
+gTTS se sustituye por FakeGTTS (latencia y tamaño configurables), y la base de
+datos, la caché y las carpetas de audio se aíslan en un directorio temporal.
+Con --upstream http las síntesis pasan por el cliente real de upstream.py contra
+un doble HTTP local, lo que incluye pool de conexiones, reintentos y cortocircuito.
+
+Uso:
+    python -m benchmarks.run --output benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json
+    python -m benchmarks.run --upstream http --fail-rate 0.1
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.fake_gtts import FakeGTTS, FakeUpstreamClient
+from benchmarks.fake_upstream import FakeUpstreamServer
+
+SAMPLE_TEXT = (
+    "Estimado cliente, su pedido número {n} ha sido enviado. "
+    "Recibirá una notificación cuando el repartidor esté cerca. "
+    "Gracias por confiar en nuestro servicio."
+)
+
+def _isolate_environment():
+    """Redirigir base de datos, caché y almacenamiento a un directorio temporal"""
+    workdir = tempfile.mkdtemp(prefix='tts_bench_')
+    os.environ['TTS_DB_PATH'] = os.path.join(workdir, 'bench.db')
+    os.environ['TTS_CACHE_DIR'] = os.path.join(workdir, 'cache')
+    os.environ['TTS_STORAGE_MAX_AGE'] = str(10 ** 9)
+    os.environ['TTS_JANITOR_INTERVAL'] = str(10 ** 6)
+    # Todas las peticiones salen del mismo cliente: sin límite de tasa
+    os.environ['TTS_RATE_LIMIT_PER_MIN'] = str(10 ** 9)
+    os.environ['TTS_RATE_LIMIT_BURST'] = str(10 ** 9)
+    # Los escenarios miden la caché fría: sin precalentamiento en segundo plano
+    os.environ['TTS_WARMUP'] = '0'
+    return workdir
+
+def _load_flask_app(workdir, upstream_server=None):
+    import engines
+    from upstream import UpstreamClient
+    if upstream_server is None:
+        engines.register(engines.GTTSEngine(FakeUpstreamClient()))
+    else:
+        engines.register(engines.GTTSEngine(UpstreamClient(base_url=upstream_server.url, backoff_base=0.01)))
+
+    import main_flask
+    public = os.path.join(workdir, 'public')
+    os.makedirs(public, exist_ok=True)
+    main_flask.PUBLIC_FOLDER = public
+    main_flask.storage_janitor.folder = public
+    main_flask.init_db()
+    return main_flask
+
+def _load_streamlit_app(workdir):
+    """Importar main.py en modo «bare» de Streamlit; None si no está instalado"""
+    try:
+        import streamlit  # noqa: F401
+    except ImportError:
+        return None
+    import main
+    folder = os.path.join(workdir, 'audio_files')
+    os.makedirs(folder, exist_ok=True)
+    main.PUBLIC_FOLDER = folder
+    return main
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def measure(fn, iterations, concurrency=1, memory_iterations=5):
+    """Medir latencia, rendimiento y pico de memoria de fn(i) -> bool"""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        start = time.perf_counter()
+        ok = fn(i)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(iterations)))
+    wall = time.perf_counter() - wall_start
+
+    # tracemalloc ralentiza cada asignación: la memoria se mide en una pasada aparte
+    tracemalloc.start()
+    for i in range(memory_iterations):
+        fn(iterations + i)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'concurrency': concurrency,
+        'errors': errors,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'p50_ms': round(_percentile(latencies, 50) * 1000, 3),
+        'p90_ms': round(_percentile(latencies, 90) * 1000, 3),
+        'p99_ms': round(_percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+        'throughput_rps': round(iterations / wall, 2) if wall else 0.0,
+        'peak_memory_kb': round(peak / 1024, 1)
+    }
+
+def flask_scenarios(app_module, args):
+    client = app_module.app.test_client()
+    run_id = uuid.uuid4().hex[:8]
+    scenarios = {}
+
+    def generate_cold(i):
+        text = SAMPLE_TEXT.format(n=f"{run_id}-{i}")
+        return client.post('/generate_audio', json={'text': text, 'lang': 'es'}).status_code == 200
+
+    def generate_warm(i):
+        text = SAMPLE_TEXT.format(n='fijo')
+        return client.post('/generate_audio', json={'text': text, 'lang': 'es'}).status_code == 200
+
+    def batch(i):
+        texts = [SAMPLE_TEXT.format(n=f"{run_id}-{i}-{k}") for k in range(5)]
+        return client.post('/generate_batch_audio', json={'texts': texts, 'lang': 'es'}).status_code == 200
+
+    def history(i):
+        return client.get('/history?limit=50').status_code == 200
+
+    scenarios['flask.generate_audio.cold'] = generate_cold
+    scenarios['flask.generate_audio.warm'] = generate_warm
+    scenarios['flask.generate_batch_audio'] = batch
+    scenarios['flask.history'] = history
+
+    if shutil.which('ffmpeg') or shutil.which('avconv'):
+        source = client.post('/generate_audio', json={'text': SAMPLE_TEXT.format(n='export'), 'lang': 'es'})
+        source.close()
+        files = sorted(os.listdir(app_module.PUBLIC_FOLDER))
+        audio_file = files[-1] if files else ''
+
+        def export(i):
+            payload = {'audio_file': audio_file, 'format': 'ogg', 'quality': 'medium'}
+            return client.post('/export_audio', json=payload).status_code == 200
+
+        scenarios['flask.export_audio'] = export
+    else:
+        scenarios['flask.export_audio'] = None
+    return scenarios
+
+def streamlit_scenarios(main_module, args):
+    if main_module is None:
+        return {'streamlit.generate_audio': None, 'streamlit.generate_batch_audio': None}
+    run_id = uuid.uuid4().hex[:8]
+
+    def generate(i):
+        return main_module.generate_audio(SAMPLE_TEXT.format(n=f"st-{run_id}-{i}"), 'es') is not None
+
+    def batch(i):
+        texts = [SAMPLE_TEXT.format(n=f"st-{run_id}-{i}-{k}") for k in range(5)]
+        return main_module.generate_batch_audio(texts, 'es') is not None
+
+    return {'streamlit.generate_audio': generate, 'streamlit.generate_batch_audio': batch}
+
+# Duración de la señal de prueba del procesado de audio (~1000 caracteres de voz)
+DSP_SECONDS = 60
+
+def dsp_scenarios(args):
+    """Etapas de procesado sobre PCM sintético (no requieren ffmpeg)"""
+    import numpy as np
+    import time_stretch
+    sample_rate = 24000
+    t = np.arange(sample_rate * DSP_SECONDS) / sample_rate
+    samples = (8000 * np.sin(2 * np.pi * 220 * t) * (1 + 0.5 * np.sin(2 * np.pi * 3 * t))).astype(np.int16)
+
+    def stretch(factor):
+        return lambda i: len(time_stretch.wsola(samples, factor, sample_rate)) > 0
+
+    return {'dsp.time_stretch.0.5x': stretch(0.5), 'dsp.time_stretch.1.5x': stretch(1.5)}
+
+def startup_scenarios(args):
+    """Arranque en frío de la API en un proceso nuevo (import + create_app)"""
+    from benchmarks.import_budget import measure_boot
+    return {'startup.create_app': lambda i: not measure_boot()['loaded']}
+
+def _seed_history(rows):
+    """Poblar el historial para que /history se mida sobre una tabla realista"""
+    import db
+    conn = db.get_connection()
+    with conn:
+        conn.executemany(
+            'INSERT INTO audio_history (text, language, filename) VALUES (?, ?, ?)',
+            ((SAMPLE_TEXT.format(n=i), 'es', f'seed_{i}.mp3') for i in range(rows))
+        )
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(current, baseline, threshold):
+    """Imprimir la comparación con una línea base y devolver las regresiones"""
+    regressions = []
+    print(f"\n{'Escenario':<36}{'p50 base':>12}{'p50 actual':>12}{'Δ':>9}")
+    for name, result in current['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if not base or 'skipped' in result or 'skipped' in base:
+            continue
+        delta = (result['p50_ms'] - base['p50_ms']) / base['p50_ms'] if base['p50_ms'] else 0.0
+        flag = ' ⚠️' if delta > threshold else ''
+        print(f"{name:<36}{base['p50_ms']:>12.2f}{result['p50_ms']:>12.2f}{delta:>+8.0%}{flag}")
+        if delta > threshold:
+            regressions.append(name)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks de Text-to-Speech Platform')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Latencia simulada por petición a gTTS')
+    parser.add_argument('--bytes-per-char', type=int, default=200, help='Tamaño del MP3 simulado por carácter')
+    parser.add_argument('--history-rows', type=int, default=10000)
+    parser.add_argument('--only', help='Ejecutar solo los escenarios que contengan este texto')
+    parser.add_argument('--output', help='Guardar los resultados en este archivo JSON')
+    parser.add_argument('--compare', help='Comparar con un JSON de resultados anterior')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Regresión tolerada en p50 (0.2 = 20%%)')
+    parser.add_argument('--upstream', choices=('fake', 'http'), default='fake',
+                        help='fake: doble en proceso; http: cliente real contra un doble HTTP local')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Proporción de 503 del doble HTTP')
+    args = parser.parse_args(argv)
+
+    FakeGTTS.configure(latency=args.latency_ms / 1000, bytes_per_char=args.bytes_per_char)
+    workdir = _isolate_environment()
+    upstream_server = None
+    if args.upstream == 'http':
+        upstream_server = FakeUpstreamServer(fail_rate=args.fail_rate).start()
+    try:
+        flask_module = _load_flask_app(workdir, upstream_server)
+        _seed_history(args.history_rows)
+        scenarios = flask_scenarios(flask_module, args)
+        scenarios.update(streamlit_scenarios(_load_streamlit_app(workdir), args))
+        scenarios.update(dsp_scenarios(args))
+        scenarios.update(startup_scenarios(args))
+
+        results = {}
+        for name, fn in scenarios.items():
+            if args.only and args.only not in name:
+                continue
+            if fn is None:
+                results[name] = {'skipped': 'dependencia no disponible (ffmpeg o streamlit)'}
+                print(f"⏭️  {name}: omitido")
+                continue
+            # Las funciones de Streamlit no son seguras entre hilos; el procesado
+            # de audio y el arranque se miden en un solo núcleo
+            serial = name.startswith(('streamlit.', 'dsp.', 'startup.'))
+            concurrency = 1 if serial else args.concurrency
+            iterations = min(args.iterations, 5) if serial else args.iterations
+            results[name] = measure(fn, iterations, concurrency, memory_iterations=min(iterations, 5))
+            r = results[name]
+            print(f"⏱️  {name}: p50={r['p50_ms']}ms p99={r['p99_ms']}ms "
+                  f"{r['throughput_rps']} req/s pico={r['peak_memory_kb']}KB errores={r['errors']}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        if upstream_server is not None:
+            upstream_server.stop()
+
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'fake_gtts': {'latency_ms': args.latency_ms, 'bytes_per_char': args.bytes_per_char},
+            'upstream': args.upstream,
+            'upstream_calls': FakeGTTS.calls if upstream_server is None else upstream_server.requests,
+            'upstream_connections': len(upstream_server.connections) if upstream_server else None
+        },
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados guardados en {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"❌ Regresiones: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""Comprobaciones del cliente de upstream.py contra el doble HTTP local
+
+Ejerce reintentos, espera exponencial y los estados del cortocircuito
+(apertura, prueba semiabierta y recuperación) con fallos inyectados en
+benchmarks.fake_upstream: códigos 503, redirecciones en bucle y cuerpos
+cortados. Falla si alguna comprobación no se cumple.
+
+Uso:
+    python -m benchmarks.upstream_resilience
+"""
+import sys
+import time
+from benchmarks.fake_gtts import FakeGTTS
+from benchmarks.fake_upstream import FakeUpstreamServer
+from upstream import UpstreamClient, CircuitBreaker, UpstreamError, UpstreamUnavailable
+
+RESET_TIMEOUT = 0.2
+
+def _client(server, max_retries=0, failure_threshold=1):
+    breaker = CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=RESET_TIMEOUT)
+    return UpstreamClient(base_url=server.url, max_retries=max_retries,
+                          backoff_base=0.01, backoff_max=0.05, breaker=breaker)
+
+def _synthesize(client):
+    return b''.join(client.stream('hola', 'es'))
+
+def _expect(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+def _expect_raises(exc_type, func):
+    try:
+        func()
+    except exc_type as e:
+        return e
+    except Exception as e:
+        raise AssertionError(f"se esperaba {exc_type.__name__}, se obtuvo {type(e).__name__}: {e}")
+    raise AssertionError(f"se esperaba {exc_type.__name__}")
+
+def check_retry_recovers(server):
+    """Los fallos transitorios se reintentan hasta obtener el audio"""
+    client = _client(server, max_retries=3, failure_threshold=10)
+    server.fail_next(2)
+    before = server.requests
+    _expect(_synthesize(client), "sin audio tras los reintentos")
+    _expect(server.requests - before == 3, f"{server.requests - before} peticiones, se esperaban 3")
+    _expect(client.breaker.state == 'closed', "el éxito debe cerrar el circuito")
+
+def check_retries_exhausted(server):
+    """Tras max_retries reintentos se abandona con UpstreamError"""
+    client = _client(server, max_retries=2, failure_threshold=10)
+    server.fail_next(10)
+    before = server.requests
+    _expect_raises(UpstreamError, lambda: _synthesize(client))
+    server.fail_next(0)
+    _expect(server.requests - before == 3, f"{server.requests - before} peticiones, se esperaban 3")
+
+def check_backoff_bounds(server):
+    """La espera es aleatoria, crece con el intento y respeta el máximo"""
+    client = _client(server)
+    for attempt in range(8):
+        limit = min(client.backoff_max, client.backoff_base * (2 ** attempt))
+        samples = [client._backoff(attempt) for _ in range(200)]
+        _expect(all(0 <= s <= limit for s in samples), f"espera fuera de [0, {limit}] en el intento {attempt}")
+
+def check_breaker_opens(server):
+    """Al alcanzar el umbral se rechaza sin tocar la red"""
+    client = _client(server, failure_threshold=3)
+    server.fail_next(3)
+    for _ in range(3):
+        _expect_raises(UpstreamError, lambda: _synthesize(client))
+    _expect(client.breaker.state == 'open', f"estado {client.breaker.state}, se esperaba open")
+    before = server.requests
+    error = _expect_raises(UpstreamUnavailable, lambda: _synthesize(client))
+    _expect(server.requests == before, "con el circuito abierto no debe haber peticiones")
+    _expect(error.retry_after >= 1, "Retry-After debe ser al menos 1 s")
+
+def _open(client, server):
+    server.fail_next(1)
+    _expect_raises(UpstreamError, lambda: _synthesize(client))
+    _expect(client.breaker.state == 'open', f"estado {client.breaker.state}, se esperaba open")
+    time.sleep(RESET_TIMEOUT)
+    _expect(client.breaker.state == 'half_open', f"estado {client.breaker.state}, se esperaba half_open")
+
+def check_half_open_recovers(server):
+    """Una prueba semiabierta con éxito cierra el circuito"""
+    client = _client(server)
+    _open(client, server)
+    _expect(_synthesize(client), "la prueba semiabierta debe devolver audio")
+    _expect(client.breaker.state == 'closed', f"estado {client.breaker.state}, se esperaba closed")
+
+def check_half_open_failure_reopens(server):
+    """Una prueba semiabierta fallida vuelve a abrir el circuito"""
+    client = _client(server)
+    _open(client, server)
+    server.fail_next(1)
+    _expect_raises(UpstreamError, lambda: _synthesize(client))
+    _expect(client.breaker.state == 'open', f"estado {client.breaker.state}, se esperaba open")
+    time.sleep(RESET_TIMEOUT)
+    _expect(_synthesize(client), "el circuito debe recuperarse tras la espera")
+
+def _check_probe_released(server, status):
+    client = _client(server)
+    _open(client, server)
+    # Suficientes fallos para agotar las redirecciones de requests (30)
+    server.fail_next(100, status=status)
+    _expect_raises(UpstreamError, lambda: _synthesize(client))
+    server.fail_next(0)
+    _expect(client.breaker.state == 'open', f"estado {client.breaker.state}, se esperaba open")
+    time.sleep(RESET_TIMEOUT)
+    _expect(_synthesize(client), "la prueba semiabierta quedó bloqueada")
+    _expect(client.breaker.state == 'closed', f"estado {client.breaker.state}, se esperaba closed")
+
+def check_probe_redirect_loop(server):
+    """Una prueba que termina en TooManyRedirects libera el turno de prueba"""
+    _check_probe_released(server, 307)
+
+def check_probe_truncated_body(server):
+    """Una prueba con el cuerpo cortado libera el turno de prueba"""
+    _check_probe_released(server, 'truncate')
+
+CHECKS = [
+    check_retry_recovers,
+    check_retries_exhausted,
+    check_backoff_bounds,
+    check_breaker_opens,
+    check_half_open_recovers,
+    check_half_open_failure_reopens,
+    check_probe_redirect_loop,
+    check_probe_truncated_body,
+]
+
+def main(argv=None):
+    FakeGTTS.configure(latency=0.0)
+    server = FakeUpstreamServer().start()
+    failed = 0
+    try:
+        for check in CHECKS:
+            server.fail_next(0)
+            try:
+                check(server)
+            except AssertionError as e:
+                failed += 1
+                print(f"❌ {check.__name__}: {e}")
+            else:
+                print(f"✅ {check.__name__}")
+    finally:
+        server.stop()
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,269 @@
+import os
+import time
+import queue
+import atexit
+import sqlite3
+import threading
+from metrics import stage
+
+# Ruta absoluta compartida por la API Flask, Streamlit y la cola de trabajos
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.environ.get('TTS_DB_PATH', os.path.join(BASE_DIR, 'tts_history.db'))
+BUSY_TIMEOUT_MS = int(os.environ.get('TTS_DB_BUSY_TIMEOUT_MS', 5000))
+# Espera máxima al salir para confirmar el historial aún en cola
+HISTORY_FLUSH_TIMEOUT = float(os.environ.get('TTS_HISTORY_FLUSH_TIMEOUT', 10))
+
+_local = threading.local()
+
+def _configure(conn):
+    """Aplicar los pragmas de rendimiento a una conexión nueva"""
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute('PRAGMA cache_size = -8000')  # ~8 MB por conexión
+
+def get_connection(db_path=None):
+    """Devolver la conexión reutilizable del hilo actual"""
+    db_path = db_path or DB_PATH
+    connections = getattr(_local, 'connections', None)
+    # Una conexión heredada a través de fork() (gunicorn --preload) no se reutiliza
+    if connections is None or _local.pid != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        _configure(conn)
+        connections[db_path] = conn
+    return conn
+
+_fts_available = None
+
+def init_db():
+    """Crear las tablas, índices y el índice de texto completo del historial"""
+    global _fts_available
+    conn = get_connection()
+    with conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS audio_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                text TEXT NOT NULL,
+                language TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                is_favorite BOOLEAN DEFAULT FALSE
+            )
+        ''')
+        # El id crece con created_at, así que la paginación usa el rowid;
+        # el filtro de favoritos necesita su propio índice
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_audio_history_favorite
+            ON audio_history (is_favorite, id)
+        ''')
+        # Migración: disponibilidad del archivo tras la limpieza de almacenamiento
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(audio_history)')}
+        if 'file_available' not in columns:
+            conn.execute('ALTER TABLE audio_history ADD COLUMN file_available BOOLEAN DEFAULT TRUE')
+        # Migración: hash del contenido calculado al escribir el archivo, para
+        # construir la URL /audio/<hash>/... del listado sin leer el archivo
+        if 'audio_digest' not in columns:
+            conn.execute('ALTER TABLE audio_history ADD COLUMN audio_digest TEXT')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_audio_history_filename
+            ON audio_history (filename)
+        ''')
+    _fts_available = _init_fts(conn)
+
+def _init_fts(conn):
+    """Crear la tabla FTS5 sincronizada por triggers; False si SQLite no tiene FTS5"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'audio_history_fts'"
+    ).fetchone()
+    if exists:
+        return True
+    try:
+        with conn:
+            conn.execute('''
+                CREATE VIRTUAL TABLE audio_history_fts USING fts5(
+                    text, content='audio_history', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS audio_history_ai AFTER INSERT ON audio_history BEGIN
+                    INSERT INTO audio_history_fts (rowid, text) VALUES (new.id, new.text);
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS audio_history_ad AFTER DELETE ON audio_history BEGIN
+                    INSERT INTO audio_history_fts (audio_history_fts, rowid, text)
+                    VALUES ('delete', old.id, old.text);
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS audio_history_au AFTER UPDATE OF text ON audio_history BEGIN
+                    INSERT INTO audio_history_fts (audio_history_fts, rowid, text)
+                    VALUES ('delete', old.id, old.text);
+                    INSERT INTO audio_history_fts (rowid, text) VALUES (new.id, new.text);
+                END
+            ''')
+            # Indexar las filas que ya existían
+            conn.execute("INSERT INTO audio_history_fts (audio_history_fts) VALUES ('rebuild')")
+        return True
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ FTS5 no disponible, la búsqueda usará LIKE: {e}")
+        return False
+
+def _fts_query(query):
+    """Convertir texto libre en una consulta FTS5 segura (términos entre comillas)"""
+    return ' '.join('"{}"'.format(term.replace('"', '""')) for term in query.split())
+
+class HistoryWriter:
+    """Cola de escritura diferida que agrupa inserciones en una sola transacción"""
+
+    def __init__(self, max_batch=100):
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                self._thread.start()
+
+    def put(self, text, language, filename, digest=None):
+        self._ensure_thread()
+        self._queue.put((text, language, filename, digest))
+
+    def flush(self, timeout=None):
+        """Esperar a que todas las inserciones pendientes estén confirmadas
+
+        Devuelve False si timeout (segundos) vence con filas aún en cola.
+        """
+        if self._thread is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _drain_at_exit(self):
+        # El hilo es daemon: sin esta espera, lo encolado se pierde al salir
+        # (fin del script, reinicio de un worker o SIGTERM -> sys.exit)
+        if not self.flush(HISTORY_FLUSH_TIMEOUT):
+            print(f"⚠️ Historial: {self._queue.unfinished_tasks} entradas sin guardar al salir")
+
+    def _run(self):
+        while True:
+            rows = [self._queue.get()]
+            while len(rows) < self.max_batch:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                conn = get_connection()
+                with stage('history_insert'), conn:
+                    conn.executemany(
+                        'INSERT INTO audio_history (text, language, filename, audio_digest) VALUES (?, ?, ?, ?)',
+                        rows
+                    )
+            except Exception as e:
+                print(f"Error guardando en historial: {e}")
+            finally:
+                for _ in rows:
+                    self._queue.task_done()
+
+history_writer = HistoryWriter()
+atexit.register(history_writer._drain_at_exit)
+
+def save_to_history(text, language, filename, digest=None):
+    """Encolar una entrada de historial para escritura diferida
+
+    digest es el SHA-256 del archivo, si ya se conoce al guardarlo.
+    """
+    history_writer.put(text, language, filename, digest)
+
+def get_history(limit=50, before_id=None, favorites_only=False, query=None):
+    """Obtener una página del historial, de la más reciente a la más antigua
+
+    La paginación es por cursor (keyset): before_id es el id de la última fila
+    de la página anterior, por lo que el coste no crece con el desplazamiento.
+    """
+    conditions = []
+    params = []
+    source = 'audio_history h'
+    # Con FTS5 se ordena por el rowid del índice para que recorra las
+    # coincidencias en orden descendente sin ordenarlas todas
+    order_key = 'h.id'
+    if query and query.strip():
+        if _fts_available:
+            source = 'audio_history_fts f JOIN audio_history h ON h.id = f.rowid'
+            order_key = 'f.rowid'
+            conditions.append('audio_history_fts MATCH ?')
+            params.append(_fts_query(query))
+        else:
+            conditions.append('h.text LIKE ?')
+            params.append(f'%{query.strip()}%')
+    if before_id is not None:
+        conditions.append(f'{order_key} < ?')
+        params.append(before_id)
+    if favorites_only:
+        conditions.append('h.is_favorite = 1')
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    params.append(limit)
+    return get_connection().execute(
+        f'SELECT h.id, h.text, h.language, h.filename, h.created_at, h.is_favorite, h.file_available, h.audio_digest '
+        f'FROM {source} {where} ORDER BY {order_key} DESC LIMIT ?', params
+    ).fetchall()
+
+def frequent_texts(limit=20, window=10000):
+    """Textos más repetidos (con su idioma) entre las últimas window entradas"""
+    return get_connection().execute(
+        'SELECT text, language, COUNT(*) AS uses FROM ('
+        '  SELECT text, language, id FROM audio_history ORDER BY id DESC LIMIT ?'
+        ') GROUP BY text, language ORDER BY uses DESC, MAX(id) DESC LIMIT ?',
+        (window, limit)
+    ).fetchall()
+
+def toggle_favorite(audio_id):
+    conn = get_connection()
+    with conn:
+        conn.execute('UPDATE audio_history SET is_favorite = NOT is_favorite WHERE id = ?', (audio_id,))
+
+def _chunks(items, size=500):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def favorite_filenames(filenames):
+    """Devolver el subconjunto de archivos marcados como favoritos"""
+    conn = get_connection()
+    favorites = set()
+    for chunk in _chunks(filenames):
+        placeholders = ', '.join('?' * len(chunk))
+        favorites.update(row[0] for row in conn.execute(
+            f'SELECT filename FROM audio_history WHERE is_favorite = 1 AND filename IN ({placeholders})',
+            chunk
+        ))
+    return favorites
+
+def mark_files_unavailable(filenames):
+    """Marcar en el historial los archivos eliminados del almacenamiento"""
+    conn = get_connection()
+    with conn:
+        for chunk in _chunks(filenames):
+            placeholders = ', '.join('?' * len(chunk))
+            conn.execute(
+                f'UPDATE audio_history SET file_available = FALSE WHERE filename IN ({placeholders})',
+                chunk
+            )
@@ -1,3 +1,3 @@
 #!/bin/sh
 source .venv/bin/activate
-python -u -m flask --app main run -p $PORT --debug
\ No newline at end of file
+python -u -m flask --app main_flask run -p $PORT --debug
\ No newline at end of file
@@ -0,0 +1,128 @@
+import os
+import shutil
+import subprocess
+import upstream
+
+# Motor por defecto, motor de respaldo y rutas por idioma ("ja:gtts,es:local")
+DEFAULT_ENGINE = os.environ.get('TTS_ENGINE', 'gtts')
+FALLBACK_ENGINE = os.environ.get('TTS_FALLBACK_ENGINE', 'local')
+ENGINE_ROUTES = dict(
+    route.split(':', 1) for route in os.environ.get('TTS_ENGINE_ROUTES', '').replace(' ', '').split(',')
+    if ':' in route
+)
+# Textos de hasta N caracteres van al motor local (0 = desactivado)
+SHORT_TEXT_CHARS = int(os.environ.get('TTS_SHORT_TEXT_CHARS', 0))
+
+ESPEAK_BIN = os.environ.get('TTS_ESPEAK_BIN', 'espeak-ng')
+FFMPEG_BIN = os.environ.get('TTS_FFMPEG_BIN', 'ffmpeg')
+LOCAL_TIMEOUT = float(os.environ.get('TTS_LOCAL_TIMEOUT', 30))
+
+class EngineError(Exception):
+    """El motor de síntesis no está disponible o falló"""
+
+class TTSEngine:
+    """Interfaz de un motor de síntesis: stream() emite bytes MP3 por fragmentos"""
+
+    name = None
+
+    def available(self):
+        return True
+
+    def stream(self, text, lang, slow=False):
+        raise NotImplementedError
+
+class GTTSEngine(TTSEngine):
+    """Google Translate TTS a través del cliente compartido de upstream.py"""
+
+    name = 'gtts'
+
+    def __init__(self, client=None):
+        self.client = client
+
+    def stream(self, text, lang, slow=False):
+        return (self.client or upstream.upstream_client).stream(text, lang, slow)
+
+class LocalEngine(TTSEngine):
+    """Síntesis sin red con espeak-ng; ffmpeg codifica a MP3
+
+    La salida se remuestrea a 24 kHz mono y 32 kbps, el mismo formato que
+    devuelve gTTS, para que la caché y la unión por tramas no distingan el
+    origen del audio.
+    """
+
+    name = 'local'
+    VOICES = {'zh': 'cmn'}
+
+    def __init__(self, espeak=ESPEAK_BIN, ffmpeg=FFMPEG_BIN, timeout=LOCAL_TIMEOUT):
+        self.espeak = espeak
+        self.ffmpeg = ffmpeg
+        self.timeout = timeout
+        self._available = None
+
+    def available(self):
+        if self._available is None:
+            self._available = bool(shutil.which(self.espeak) and shutil.which(self.ffmpeg))
+        return self._available
+
+    def stream(self, text, lang, slow=False):
+        if not self.available():
+            raise EngineError("Motor local no disponible (requiere espeak-ng y ffmpeg)")
+        voice = self.VOICES.get(lang, lang)
+        try:
+            wav = subprocess.run(
+                [self.espeak, '-v', voice, '-s', '130' if slow else '175', '--stdin', '--stdout'],
+                input=text.encode('utf-8'), capture_output=True, timeout=self.timeout, check=True
+            ).stdout
+            mp3 = subprocess.run(
+                [self.ffmpeg, '-hide_banner', '-loglevel', 'error', '-f', 'wav', '-i', 'pipe:0',
+                 '-ac', '1', '-ar', '24000', '-b:a', '32k', '-f', 'mp3',
+                 '-id3v2_version', '0', '-write_xing', '0', 'pipe:1'],
+                input=wav, capture_output=True, timeout=self.timeout, check=True
+            ).stdout
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+            raise EngineError(f"Error en el motor local: {e}") from e
+        yield mp3
+
+engines = {}
+
+def register(engine):
+    """Registrar (o reemplazar) un motor por su nombre"""
+    engines[engine.name] = engine
+    return engine
+
+register(GTTSEngine())
+register(LocalEngine())
+
+def engine_choices():
+    """Valores aceptados en el parámetro engine de las peticiones"""
+    return ['auto'] + list(engines)
+
+def get_engine(name):
+    try:
+        return engines[name]
+    except KeyError:
+        raise ValueError(f"Motor no soportado: {name}") from None
+
+def route(text, lang, requested=None):
+    """Devolver la lista ordenada de motores a intentar para una petición
+
+    Un motor pedido explícitamente se usa sin respaldo; en modo automático se
+    aplican la ruta por idioma (o el atajo local para textos cortos) y después
+    el motor de respaldo, omitiendo los que no están disponibles.
+    """
+    if requested and requested != 'auto':
+        get_engine(requested)
+        return [requested]
+
+    if SHORT_TEXT_CHARS and len(text) <= SHORT_TEXT_CHARS:
+        primary = 'local'
+    else:
+        primary = ENGINE_ROUTES.get(lang, DEFAULT_ENGINE)
+    chain = []
+    for name in (primary, DEFAULT_ENGINE, FALLBACK_ENGINE):
+        if name in engines and name not in chain and engines[name].available():
+            chain.append(name)
+    return chain or [DEFAULT_ENGINE]
+
+def engines_info():
+    return {name: {"available": engine.available()} for name, engine in engines.items()}
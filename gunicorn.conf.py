@@ -0,0 +1,24 @@
+"""
+Configuración de gunicorn para el modo multiproceso
+
+    gunicorn -c gunicorn.conf.py
+
+Los trabajadores comparten la caché de síntesis (índice SQLite en cada
+carpeta de caché), el historial y la cola de trabajos. Cada uno carga la
+aplicación después del fork, así que create_app() arranca sus propios hilos
+en segundo plano.
+"""
+import os
+import multiprocessing
+
+wsgi_app = 'wsgi:application'
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# Hilos por trabajador: las peticiones pasan casi todo el tiempo esperando a gTTS
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+# Las respuestas en streaming mantienen la conexión abierta
+keepalive = 5
+# Sin precarga: los hilos y las conexiones SQLite no sobreviven a un fork
+preload_app = False
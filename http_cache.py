@@ -0,0 +1,38 @@
+import os
+from flask import send_file
+from audio_cache import file_digest
+
+# Las URL con hash de contenido nunca cambian de contenido: caché de un año
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+URL_DIGEST_LENGTH = 32
+MIN_URL_DIGEST_LENGTH = 16
+
+def audio_url(filepath, digest=None):
+    """URL direccionada por contenido de un archivo de la carpeta pública
+
+    Con digest (ya calculado al escribir el archivo) no se lee el disco.
+    """
+    digest = (digest or file_digest(filepath))[:URL_DIGEST_LENGTH]
+    return f"/audio/{digest}/{os.path.basename(filepath)}"
+
+def digest_matches(filepath, digest):
+    """Comprobar que el hash de la URL corresponde al contenido actual"""
+    return len(digest) >= MIN_URL_DIGEST_LENGTH and file_digest(filepath).startswith(digest.lower())
+
+def send_cached(filepath, immutable=False, **kwargs):
+    """send_file con ETag fuerte por contenido, 304 y rangos de bytes
+
+    immutable=True solo para URL cuyo contenido no puede cambiar (con hash o
+    nombre único); el resto se revalida en cada uso con If-None-Match.
+    """
+    response = send_file(filepath, conditional=True, etag=file_digest(filepath), **kwargs)
+    # Anunciar los rangos también en la respuesta completa para permitir saltos
+    response.headers.setdefault('Accept-Ranges', 'bytes')
+    if immutable:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,124 @@
+import os
+import time
+import threading
+import db
+
+STORAGE_MAX_BYTES = int(os.environ.get('TTS_STORAGE_MAX_BYTES', 1024 * 1024 * 1024))
+STORAGE_MAX_AGE = int(os.environ.get('TTS_STORAGE_MAX_AGE', 3600))
+JANITOR_INTERVAL = int(os.environ.get('TTS_JANITOR_INTERVAL', 60))
+
+class StorageJanitor:
+    """Limpieza periódica de una carpeta de audio con presupuesto de tamaño y edad
+
+    Mantiene un índice en memoria de los archivos (actualizado con track()) para
+    no recorrer el directorio completo en cada pasada; solo se reconcilia con el
+    disco cada rescan_every pasadas. Los favoritos nunca se eliminan y las
+    entradas del historial cuyos archivos se borran quedan marcadas como no
+    disponibles.
+    """
+
+    def __init__(self, folder, max_bytes=STORAGE_MAX_BYTES, max_age=STORAGE_MAX_AGE,
+                 interval=JANITOR_INTERVAL, rescan_every=60):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.interval = interval
+        self.rescan_every = rescan_every
+        self._files = {}  # nombre -> (mtime, tamaño)
+        self._size = 0
+        self._passes = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def track(self, filepath):
+        """Registrar un archivo recién escrito en la carpeta"""
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return
+        name = os.path.basename(filepath)
+        with self._lock:
+            previous = self._files.get(name)
+            if previous:
+                self._size -= previous[1]
+            self._files[name] = (stat.st_mtime, stat.st_size)
+            self._size += stat.st_size
+
+    def rescan(self):
+        """Reconstruir el índice a partir del contenido real de la carpeta"""
+        files = {}
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                # Los .part son escrituras en curso
+                if entry.is_file() and not entry.name.endswith('.part'):
+                    stat = entry.stat()
+                    files[entry.name] = (stat.st_mtime, stat.st_size)
+        with self._lock:
+            self._files = files
+            self._size = sum(size for _, size in files.values())
+
+    def run_once(self):
+        """Ejecutar una pasada de limpieza y devolver los archivos eliminados"""
+        if self._passes % self.rescan_every == 0:
+            self.rescan()
+        self._passes += 1
+
+        now = time.time()
+        with self._lock:
+            candidates = sorted(self._files.items(), key=lambda item: item[1][0])
+            total = self._size
+
+        def over_budget(mtime):
+            return total > self.max_bytes or now - mtime > self.max_age
+
+        # Del más antiguo al más reciente; solo se consulta la base de datos
+        # por los bloques de archivos que realmente sobran
+        removed = []
+        for start in range(0, len(candidates), 100):
+            chunk = candidates[start:start + 100]
+            if not over_budget(chunk[0][1][0]):
+                break
+            favorites = db.favorite_filenames([name for name, _ in chunk])
+            for name, (mtime, size) in chunk:
+                if not over_budget(mtime):
+                    break
+                if name in favorites:
+                    continue
+                try:
+                    os.remove(os.path.join(self.folder, name))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"Error en limpieza: {e}")
+                    continue
+                removed.append(name)
+                total -= size
+                with self._lock:
+                    if self._files.pop(name, None):
+                        self._size -= size
+
+        if removed:
+            db.mark_files_unavailable(removed)
+            print(f"🗑️ {len(removed)} archivos limpiados en {self.folder}")
+        return removed
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error en limpieza: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Arrancar el hilo de limpieza en segundo plano (una sola vez)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='storage-janitor', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
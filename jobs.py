@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import traceback
+from db import DB_PATH, get_connection
+
+# Los trabajos se guardan en la misma base de datos que el historial
+JOB_WORKERS = int(os.environ.get('TTS_JOB_WORKERS', 2))
+# Un trabajo 'running' sin latido durante este tiempo se da por huérfano
+JOB_LEASE = int(os.environ.get('TTS_JOB_LEASE', 60))
+
+class Job:
+    """Vista de un trabajo en ejecución que permite informar el progreso"""
+
+    def __init__(self, queue, job_id, payload):
+        self.queue = queue
+        self.id = job_id
+        self.payload = payload
+
+    def report_progress(self, progress):
+        self.queue._update(self.id, progress=round(float(progress), 4))
+
+class JobQueue:
+    """Cola de trabajos persistente en SQLite con un pool local de trabajadores
+
+    Varios procesos pueden compartir la cola: cada uno renueva periódicamente
+    updated_at de sus trabajos en curso y los que dejan de latir más de lease
+    segundos (proceso caído o reiniciado) vuelven a la cola.
+    """
+
+    def __init__(self, db_path=DB_PATH, workers=JOB_WORKERS, poll_interval=1.0, lease=JOB_LEASE):
+        self.db_path = db_path
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self._running = set()
+        self._running_lock = threading.Lock()
+        self._handlers = {}
+        self._wakeup = threading.Event()
+        self._start_lock = threading.Lock()
+        self._threads = []
+
+    def _connect(self):
+        return get_connection(self.db_path)
+
+    def init_schema(self):
+        conn = self._connect()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS synthesis_jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    progress REAL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_synthesis_jobs_status
+                ON synthesis_jobs (status, created_at)
+            ''')
+
+    def register(self, kind, handler):
+        """Registrar la función que procesa los trabajos de un tipo"""
+        self._handlers[kind] = handler
+
+    def ensure_started(self):
+        """Crear el esquema y arrancar los trabajadores una sola vez"""
+        with self._start_lock:
+            if self._threads:
+                return
+            self.init_schema()
+            for n in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'tts-job-{n}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._heartbeat, name='tts-job-heartbeat', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, kind, payload):
+        """Encolar un trabajo y devolver su identificador"""
+        if kind not in self._handlers:
+            raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+        self.ensure_started()
+        job_id = uuid.uuid4().hex
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT INTO synthesis_jobs (id, kind, payload) VALUES (?, ?, ?)',
+                (job_id, kind, json.dumps(payload, ensure_ascii=False))
+            )
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        """Devolver el estado de un trabajo o None si no existe"""
+        self.ensure_started()
+        row = self._connect().execute(
+            'SELECT id, kind, status, progress, result, error, created_at, updated_at '
+            'FROM synthesis_jobs WHERE id = ?', (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def _claim(self):
+        """Tomar de forma atómica el trabajo pendiente más antiguo"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Recuperar los trabajos huérfanos (su proceso dejó de latir)
+            conn.execute(
+                "UPDATE synthesis_jobs SET status = 'queued' WHERE status = 'running' "
+                "AND updated_at < datetime('now', ?)", (f'-{self.lease} seconds',)
+            )
+            row = conn.execute(
+                "SELECT id, kind, payload FROM synthesis_jobs WHERE status = 'queued' "
+                "ORDER BY created_at, rowid LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE synthesis_jobs SET status = 'running', updated_at = CURRENT_TIMESTAMP "
+                    "WHERE id = ?", (row['id'],)
+                )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        if row is None:
+            return None
+        return row['id'], row['kind'], json.loads(row['payload'])
+
+    def _update(self, job_id, **fields):
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                f'UPDATE synthesis_jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                (*fields.values(), job_id)
+            )
+
+    def _heartbeat(self):
+        """Renovar updated_at de los trabajos en curso de este proceso"""
+        while True:
+            time.sleep(max(self.lease / 3, 1))
+            with self._running_lock:
+                running = list(self._running)
+            if not running:
+                continue
+            try:
+                conn = self._connect()
+                with conn:
+                    conn.execute(
+                        f"UPDATE synthesis_jobs SET updated_at = CURRENT_TIMESTAMP "
+                        f"WHERE status = 'running' AND id IN ({', '.join('?' * len(running))})", running
+                    )
+            except sqlite3.Error as e:
+                print(f"Error renovando trabajos en curso: {e}")
+
+    def _worker(self):
+        while True:
+            try:
+                claimed = self._claim()
+            except sqlite3.Error as e:
+                print(f"Error leyendo la cola de trabajos: {e}")
+                claimed = None
+            if claimed is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            job_id, kind, payload = claimed
+            with self._running_lock:
+                self._running.add(job_id)
+            try:
+                result = self._handlers[kind](payload, Job(self, job_id, payload))
+                self._update(job_id, status='done', progress=1.0,
+                             result=json.dumps(result, ensure_ascii=False))
+            except Exception as e:
+                traceback.print_exc()
+                self._update(job_id, status='failed', error=str(e))
+            finally:
+                with self._running_lock:
+                    self._running.discard(job_id)
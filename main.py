@@ -1,12 +1,16 @@
 import streamlit as st
 import os
 import time
-import sqlite3
 from datetime import datetime
-from gtts import gTTS
-import zipfile
 import io
-import base64
+from tts_service import synthesize_to_file, synthesize_batch_events
+from zip_stream import stream_zip
+import db
+import storage
+from janitor import StorageJanitor
+from upstream import UpstreamUnavailable
+from engines import engine_choices, engines_info
+from warmup import CacheWarmer
 
 # Configuración de la página
 st.set_page_config(
@@ -21,63 +25,94 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PUBLIC_FOLDER = os.path.join(BASE_DIR, 'audio_files')
 os.makedirs(PUBLIC_FOLDER, exist_ok=True)
 
+LANGUAGES = {
+    'es': 'Español',
+    'en': 'English',
+    'fr': 'Français',
+    'de': 'Deutsch',
+    'it': 'Italiano',
+    'pt': 'Português',
+    'ru': 'Русский',
+    'ja': '日本語',
+    'ko': '한국어',
+    'zh': '中文'
+}
+
+TEMPLATES = {
+    'Personalizado': '',
+    'Podcast Intro': "Bienvenidos a nuestro podcast. Hoy hablaremos sobre...",
+    'Notificación': "Atención: Tiene una nueva notificación...",
+    'Anuncio': "Estimados usuarios, queremos anunciar que...",
+    'Tutorial': "En este tutorial aprenderemos paso a paso cómo...",
+    'Saludo': "¡Hola! Bienvenido a nuestra plataforma.",
+    'Despedida': "Gracias por usar nuestro servicio. ¡Hasta pronto!"
+}
+
 # Inicializar base de datos
 @st.cache_resource
 def init_db():
     try:
-        conn = sqlite3.connect('tts_history.db', check_same_thread=False)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS audio_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                text TEXT NOT NULL,
-                language TEXT NOT NULL,
-                filename TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_favorite BOOLEAN DEFAULT FALSE
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        db.init_db()
         return True
     except Exception as e:
         st.error(f"❌ Error inicializando base de datos: {e}")
         return False
 
+# Limpieza periódica de audio_files (un solo hilo por proceso)
+@st.cache_resource
+def get_storage_janitor():
+    janitor = StorageJanitor(PUBLIC_FOLDER)
+    janitor.start()
+    return janitor
+
+# Precalentar plantillas y textos frecuentes en segundo plano (una vez por proceso)
+@st.cache_resource
+def get_cache_warmer():
+    warmer = CacheWarmer([text for text in TEMPLATES.values() if text], LANGUAGES)
+    warmer.start()
+    return warmer
+
 def save_to_history(text, language, filename):
+    # Escritura diferida: las inserciones se agrupan en una sola transacción
     try:
-        conn = sqlite3.connect('tts_history.db', check_same_thread=False)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO audio_history (text, language, filename)
-            VALUES (?, ?, ?)
-        ''', (text, language, filename))
-        conn.commit()
-        conn.close()
+        db.save_to_history(text, language, filename)
     except Exception as e:
         st.error(f"Error guardando en historial: {e}")
 
 def get_history():
     try:
-        conn = sqlite3.connect('tts_history.db', check_same_thread=False)
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM audio_history ORDER BY created_at DESC LIMIT 20')
-        history = cursor.fetchall()
-        conn.close()
-        return history
+        # Incluir las inserciones aún pendientes de esta sesión
+        db.history_writer.flush()
+        return db.get_history(20)
     except Exception as e:
         st.error(f"Error obteniendo historial: {e}")
         return []
 
-def get_audio_download_link(file_path, file_name):
-    """Generar enlace de descarga para archivo de audio"""
+@st.cache_data(max_entries=32, show_spinner=False)
+def load_audio_bytes(file_path, mtime):
+    """Leer un archivo de audio (caché acotada en memoria por ruta y mtime)"""
     with open(file_path, "rb") as f:
-        audio_bytes = f.read()
-    
-    b64 = base64.b64encode(audio_bytes).decode()
-    return f'<a href="data:audio/mp3;base64,{b64}" download="{file_name}">📥 Descargar {file_name}</a>'
+        return f.read()
+
+def read_audio(file_path):
+    """Devolver los bytes de un audio desde la caché, o None si no existe"""
+    try:
+        mtime = os.path.getmtime(file_path)
+    except OSError:
+        return None
+    return load_audio_bytes(file_path, mtime)
 
-def generate_audio(text, language, speed=1.0):
+def audio_download_button(audio_bytes, file_name, key=None):
+    """Botón de descarga servido por referencia (URL de medios) en lugar de data: URI"""
+    st.download_button(
+        label=f"📥 Descargar {file_name}",
+        data=audio_bytes,
+        file_name=file_name,
+        mime="audio/mpeg",
+        key=key
+    )
+
+def generate_audio(text, language, speed=1.0, engine=None):
     """Generar archivo de audio"""
     try:
         # Validaciones
@@ -90,45 +125,32 @@ def generate_audio(text, language, speed=1.0):
             return None
         
         # Generar nombre único
-        timestamp = int(time.time())
-        filename = f'tts_audio_{timestamp}.mp3'
+        filename = storage.unique_filename('tts_audio', 'mp3')
         filepath = os.path.join(PUBLIC_FOLDER, filename)
         
-        # Crear progreso
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        status_text.text("🎤 Generando audio...")
-        progress_bar.progress(30)
-        
-        # Generar TTS
-        tts = gTTS(text=text, lang=language, slow=(speed < 0.8))
-        
-        progress_bar.progress(70)
-        status_text.text("💾 Guardando archivo...")
-        
-        tts.save(filepath)
-        
-        progress_bar.progress(90)
-        status_text.text("📝 Guardando en historial...")
-        
-        # Guardar en historial
-        save_to_history(text, language, filename)
-        
-        progress_bar.progress(100)
-        status_text.text("✅ ¡Audio generado exitosamente!")
+        # Una sola síntesis no tiene pasos intermedios medibles: indicador de
+        # actividad y el tiempo real al terminar
+        start = time.perf_counter()
+        with st.spinner("🎤 Generando audio..."):
+            # Generar TTS (o recuperarlo de la caché) y guardar archivo
+            synthesize_to_file(text, language, filepath, speed=speed, engine=engine)
+            get_storage_janitor().track(filepath)
+            
+            # Guardar en historial
+            save_to_history(text, language, filename)
         
-        time.sleep(1)
-        progress_bar.empty()
-        status_text.empty()
+        st.caption(f"✅ ¡Audio generado exitosamente! ({time.perf_counter() - start:.2f} s)")
         
         return filepath, filename
         
+    except UpstreamUnavailable as e:
+        st.warning(f"⏳ El servicio de síntesis no está disponible. Reintente en {e.retry_after} s.")
+        return None
     except Exception as e:
         st.error(f"❌ Error generando audio: {str(e)}")
         return None
 
-def generate_batch_audio(texts, language):
+def generate_batch_audio(texts, language, engine=None):
     """Generar múltiples archivos de audio"""
     try:
         if not texts or len(texts) > 10:
@@ -137,42 +159,40 @@ def generate_batch_audio(texts, language):
             
         timestamp = int(time.time())
         zip_filename = f"batch_audio_{timestamp}.zip"
-        zip_filepath = os.path.join(PUBLIC_FOLDER, zip_filename)
         
         progress_bar = st.progress(0)
         status_text = st.empty()
         
-        with zipfile.ZipFile(zip_filepath, 'w') as zip_file:
-            total_texts = len([t for t in texts if t.strip()])
-            
-            for i, text in enumerate(texts):
-                if not text.strip():
+        # Encolar todos los textos en el pool de trabajadores
+        items = [(i, text.strip()) for i, text in enumerate(texts) if text.strip()]
+        total_texts = len(items)
+        status_text.text(f"🎤 Generando {total_texts} audios...")
+        
+        def entries():
+            # La barra avanza con cada audio terminado, en el orden en que terminan
+            done = 0
+            for event in synthesize_batch_events([text for _, text in items], language, engine=engine):
+                if event['event'] == 'queued':
                     continue
-                    
-                status_text.text(f"🎤 Generando audio {i+1}/{total_texts}...")
-                progress = int((i / total_texts) * 100)
-                progress_bar.progress(progress)
+                done += 1
+                i = items[event['index']][0]
+                progress_bar.progress(done / total_texts)
+                status_text.text(f"🎤 {done}/{total_texts} audios listos "
+                                 f"(audio {i+1}: {event['synthesis_ms']:.0f} ms)")
                 
-                filename = f"batch_audio_{i+1}_{timestamp}.mp3"
-                filepath = os.path.join(PUBLIC_FOLDER, filename)
-                
-                tts = gTTS(text=text.strip(), lang=language)
-                tts.save(filepath)
-                
-                # Agregar al ZIP
-                zip_file.write(filepath, filename)
+                if event['event'] == 'failed':
+                    st.warning(f"⚠️ No se pudo generar el audio {i+1}: {event['error']}")
+                    continue
                 
-                # Limpiar archivo temporal
-                os.remove(filepath)
+                yield f"batch_audio_{i+1}_{timestamp}.mp3", event['data']
         
-        progress_bar.progress(100)
-        status_text.text("✅ ¡Archivos generados exitosamente!")
+        # El ZIP se construye en memoria, sin archivos temporales
+        zip_bytes = b''.join(stream_zip(entries()))
         
-        time.sleep(1)
         progress_bar.empty()
-        status_text.empty()
+        status_text.text(f"✅ ¡Archivos generados exitosamente! ({total_texts} audios)")
         
-        return zip_filepath, zip_filename
+        return zip_bytes, zip_filename
         
     except Exception as e:
         st.error(f"❌ Error generando archivos: {str(e)}")
@@ -180,6 +200,8 @@ def generate_batch_audio(texts, language):
 
 # Inicializar base de datos
 init_db()
+get_storage_janitor()
+get_cache_warmer()
 
 # Interfaz principal
 def main():
@@ -193,23 +215,10 @@ def main():
         st.header("⚙️ Configuración")
         
         # Selección de idioma
-        languages = {
-            'es': 'Español',
-            'en': 'English',
-            'fr': 'Français',
-            'de': 'Deutsch',
-            'it': 'Italiano',
-            'pt': 'Português',
-            'ru': 'Русский',
-            'ja': '日本語',
-            'ko': '한국어',
-            'zh': '中文'
-        }
-        
         selected_lang = st.selectbox(
             "🌍 Idioma",
-            options=list(languages.keys()),
-            format_func=lambda x: languages[x],
+            options=list(LANGUAGES.keys()),
+            format_func=lambda x: LANGUAGES[x],
             index=0
         )
         
@@ -222,21 +231,20 @@ def main():
             step=0.1
         )
         
+        # Motor de síntesis ('auto' usa la ruta por idioma y el respaldo local)
+        available_engines = engines_info()
+        engine = st.selectbox(
+            "🧠 Motor de voz",
+            options=engine_choices(),
+            format_func=lambda x: x if x == 'auto' or available_engines[x]['available'] else f"{x} (no disponible)",
+            index=0
+        )
+        
         st.markdown("---")
         
         # Plantillas predefinidas
         st.subheader("📝 Plantillas")
-        templates = {
-            'Personalizado': '',
-            'Podcast Intro': "Bienvenidos a nuestro podcast. Hoy hablaremos sobre...",
-            'Notificación': "Atención: Tiene una nueva notificación...",
-            'Anuncio': "Estimados usuarios, queremos anunciar que...",
-            'Tutorial': "En este tutorial aprenderemos paso a paso cómo...",
-            'Saludo': "¡Hola! Bienvenido a nuestra plataforma.",
-            'Despedida': "Gracias por usar nuestro servicio. ¡Hasta pronto!"
-        }
-        
-        selected_template = st.selectbox("Seleccionar plantilla", list(templates.keys()))
+        selected_template = st.selectbox("Seleccionar plantilla", list(TEMPLATES.keys()))
     
     # Tabs principales
     tab1, tab2, tab3 = st.tabs(["🎤 Generar Audio", "📦 Modo Lote", "📜 Historial"])
@@ -245,7 +253,7 @@ def main():
         st.header("🎤 Generación Individual")
         
         # Área de texto
-        default_text = templates[selected_template] if selected_template != 'Personalizado' else ''
+        default_text = TEMPLATES[selected_template] if selected_template != 'Personalizado' else ''
         
         text_input = st.text_area(
             "Ingresa tu texto:",
@@ -267,7 +275,7 @@ def main():
         with col1:
             if st.button("🎤 Generar Audio", type="primary", use_container_width=True):
                 if text_input.strip():
-                    result = generate_audio(text_input, selected_lang, speed)
+                    result = generate_audio(text_input, selected_lang, speed, engine)
                     if result:
                         filepath, filename = result
                         
@@ -275,13 +283,11 @@ def main():
                         st.success("✅ Audio generado exitosamente")
                         
                         # Reproducir audio
-                        with open(filepath, 'rb') as audio_file:
-                            audio_bytes = audio_file.read()
-                            st.audio(audio_bytes, format='audio/mp3')
+                        audio_bytes = read_audio(filepath)
+                        st.audio(audio_bytes, format='audio/mp3')
                         
                         # Enlace de descarga
-                        download_link = get_audio_download_link(filepath, filename)
-                        st.markdown(download_link, unsafe_allow_html=True)
+                        audio_download_button(audio_bytes, filename)
                 else:
                     st.error("❌ Por favor, ingresa algún texto")
         
@@ -309,16 +315,13 @@ def main():
         if st.button("📦 Generar Lote", type="primary"):
             valid_texts = [t for t in texts if t.strip()]
             if valid_texts:
-                result = generate_batch_audio(valid_texts, selected_lang)
+                result = generate_batch_audio(valid_texts, selected_lang, engine)
                 if result:
-                    zip_filepath, zip_filename = result
+                    zip_bytes, zip_filename = result
                     
                     st.success(f"✅ Generados {len(valid_texts)} archivos de audio")
                     
                     # Enlace de descarga del ZIP
-                    with open(zip_filepath, 'rb') as zip_file:
-                        zip_bytes = zip_file.read()
-                    
                     st.download_button(
                         label="📥 Descargar ZIP",
                         data=zip_bytes,
@@ -335,30 +338,39 @@ def main():
         
         if history:
             for item in history:
-                id_audio, text, language, filename, created_at, is_favorite = item
+                id_audio, text, language, filename, created_at, is_favorite, file_available = item[:7]
                 
                 with st.expander(f"🎵 {text[:50]}..." if len(text) > 50 else f"🎵 {text}"):
                     col1, col2, col3 = st.columns([3, 1, 1])
                     
                     with col1:
                         st.write(f"**Texto:** {text}")
-                        st.write(f"**Idioma:** {languages.get(language, language)}")
+                        st.write(f"**Idioma:** {LANGUAGES.get(language, language)}")
                         st.write(f"**Fecha:** {created_at}")
                     
+                    filepath = os.path.join(PUBLIC_FOLDER, filename)
+                    if not (file_available and os.path.exists(filepath)):
+                        with col3:
+                            st.write("❌ Archivo no disponible")
+                        continue
+                    
+                    # El cuerpo de un expander se ejecuta en cada rerun aunque
+                    # esté cerrado: el audio solo se lee al activar el selector
                     with col2:
-                        # Reproducir si el archivo existe
-                        filepath = os.path.join(PUBLIC_FOLDER, filename)
-                        if os.path.exists(filepath):
-                            with open(filepath, 'rb') as audio_file:
-                                audio_bytes = audio_file.read()
-                                st.audio(audio_bytes, format='audio/mp3')
+                        load_audio = st.toggle("🎧 Cargar audio", key=f"history_audio_{id_audio}")
                     
-                    with col3:
-                        if os.path.exists(filepath):
-                            download_link = get_audio_download_link(filepath, filename)
-                            st.markdown(download_link, unsafe_allow_html=True)
-                        else:
-                            st.write("❌ Archivo no disponible")
+                    if load_audio:
+                        audio_bytes = read_audio(filepath)
+                        if audio_bytes is None:
+                            with col3:
+                                st.write("❌ Archivo no disponible")
+                            continue
+                        
+                        with col2:
+                            st.audio(audio_bytes, format='audio/mp3')
+                        
+                        with col3:
+                            audio_download_button(audio_bytes, filename, key=f"history_download_{id_audio}")
         else:
             st.info("📭 No hay archivos en el historial")
     
@@ -1,26 +1,49 @@
 import os
-from gtts import gTTS
-from flask import Flask, request, jsonify, send_file, send_from_directory
-import sqlite3
+from flask import (
+    Blueprint, Flask, Response, current_app, g, request, jsonify, send_file, send_from_directory,
+    stream_with_context
+)
 from datetime import datetime
 import time
-from pydub import AudioSegment
 import zipfile
 import io
+import json
 import threading
 import signal
+import uuid
 import sys
+from concurrent.futures import as_completed
+from tts_service import (
+    audio_cache, segment_cache, synthesize_to_file, synthesize_stream,
+    synthesize_batch, submit_batch, synthesize_batch_events, synthesize_document
+)
+from zip_stream import stream_zip
+from jobs import JobQueue
+import db
+from janitor import StorageJanitor
+import metrics
+from admission import admission_required
+from transcode import EXPORT_FORMATS, export_caches, transcode
+from upstream import UpstreamError, UpstreamUnavailable, upstream_client
+from engines import EngineError, engine_choices, engines_info
+import postprocess
+import pcm
+from werkzeug.security import safe_join
+from http_cache import audio_url, digest_matches, send_cached
+from audio_cache import file_digest
+from warmup import CacheWarmer
+import storage
+from config import config
 
-app = Flask(__name__)
+# Las rutas se registran en la aplicación que crea create_app()
+bp = Blueprint('tts', __name__)
 
 # Configuración mejorada de rutas y carpetas
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 STATIC_FOLDER = os.path.join(BASE_DIR, 'src')
 PUBLIC_FOLDER = os.path.join(STATIC_FOLDER, 'public')
 AUDIO_FILE = os.path.join(PUBLIC_FOLDER, 'tts_audio.mp3')
-
-# Crear directorios si no existen
-os.makedirs(PUBLIC_FOLDER, exist_ok=True)
+UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
 
 # Detectar si estamos en Streamlit Cloud
 def is_streamlit_cloud():
@@ -39,57 +62,46 @@ def safe_signal_handler():
 # Inicializar base de datos
 def init_db():
     try:
-        conn = sqlite3.connect('tts_history.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS audio_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                text TEXT NOT NULL,
-                language TEXT NOT NULL,
-                filename TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_favorite BOOLEAN DEFAULT FALSE
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        db.init_db()
         print("✅ Base de datos inicializada correctamente")
     except Exception as e:
         print(f"❌ Error inicializando base de datos: {e}")
 
-def save_to_history(text, language, filename):
+def save_to_history(text, language, filename, filepath=None):
+    # Escritura diferida: las inserciones se agrupan en una sola transacción.
+    # El hash del archivo recién escrito se guarda con la fila para que
+    # /history construya audio_url sin leer el disco
+    try:
+        digest = file_digest(filepath) if filepath else None
+    except OSError:
+        digest = None
     try:
-        conn = sqlite3.connect('tts_history.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO audio_history (text, language, filename)
-            VALUES (?, ?, ?)
-        ''', (text, language, filename))
-        conn.commit()
-        conn.close()
+        db.save_to_history(text, language, filename, digest)
     except Exception as e:
         print(f"Error guardando en historial: {e}")
 
-# Limpiar archivos antiguos
-def cleanup_old_files():
-    try:
-        current_time = time.time()
-        for filename in os.listdir(PUBLIC_FOLDER):
-            filepath = os.path.join(PUBLIC_FOLDER, filename)
-            # Eliminar archivos más antiguos de 1 hora
-            if os.path.isfile(filepath) and current_time - os.path.getctime(filepath) > 3600:
-                os.remove(filepath)
-                print(f"🗑️ Archivo limpiado: {filename}")
-    except Exception as e:
-        print(f"Error en limpieza: {e}")
+# Limpieza periódica de archivos antiguos con presupuesto de disco
+storage_janitor = StorageJanitor(PUBLIC_FOLDER)
 
 # Servir archivos estáticos desde /src
-@app.route('/src/<path:filename>')
+@bp.route('/src/<path:filename>')
 def static_files(filename):
-    return send_from_directory(STATIC_FOLDER, filename)
+    # ETag fuerte por contenido: el navegador revalida y recibe 304 sin cuerpo
+    filepath = safe_join(STATIC_FOLDER, filename)
+    if filepath is None or not os.path.isfile(filepath):
+        return send_from_directory(STATIC_FOLDER, filename)
+    return send_cached(filepath)
+
+# Audio direccionado por contenido: la URL cambia si cambia el archivo
+@bp.route('/audio/<digest>/<path:filename>')
+def hashed_audio(digest, filename):
+    filepath = safe_join(PUBLIC_FOLDER, filename)
+    if filepath is None or not os.path.isfile(filepath) or not digest_matches(filepath, digest):
+        return jsonify({"error": "Archivo no encontrado"}), 404
+    return send_cached(filepath, immutable=True, mimetype='audio/mpeg')
 
 # Servir favicon
-@app.route('/favicon.ico')
+@bp.route('/favicon.ico')
 def favicon():
     favicon_path = os.path.join(STATIC_FOLDER, 'favicon.ico')
     if os.path.exists(favicon_path):
@@ -98,7 +110,7 @@ def favicon():
         return '', 204
 
 # Ruta al frontend
-@app.route("/")
+@bp.route("/")
 def index():
     index_path = os.path.join(STATIC_FOLDER, 'index.html')
     if os.path.exists(index_path):
@@ -120,8 +132,54 @@ def index():
         </html>
         """, 200
 
+# Métricas por ruta: contador, histograma de latencia y peticiones en curso
+def _route_label():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+@bp.before_app_request
+def start_request_metrics():
+    g.metrics_start = time.perf_counter()
+    g.metrics_route = _route_label()
+    metrics.HTTP_IN_FLIGHT.inc(route=g.metrics_route)
+
+@bp.after_app_request
+def record_request_metrics(response):
+    if 'metrics_start' in g:
+        start, route, method = g.metrics_start, g.metrics_route, request.method
+        metrics.HTTP_REQUESTS.inc(route=route, method=method, status=response.status_code)
+        
+        def finish():
+            metrics.HTTP_LATENCY.observe(time.perf_counter() - start, route=route, method=method)
+            metrics.HTTP_IN_FLIGHT.dec(route=route)
+        
+        if response.content_length is None:
+            # Cuerpo generado en streaming: la petición termina cuando el
+            # servidor cierra la respuesta, no al salir de la vista
+            response.call_on_close(finish)
+        else:
+            finish()
+        g.metrics_finished = True
+    return response
+
+@bp.teardown_app_request
+def finish_request_metrics(error=None):
+    # Sin respuesta (excepción no gestionada) solo queda liberar el contador
+    if 'metrics_route' in g and 'metrics_finished' not in g:
+        metrics.HTTP_IN_FLIGHT.dec(route=g.metrics_route)
+
+metrics.registry.add_collector(metrics.cache_collector(lambda: {
+    'tts': audio_cache,
+    'segments': segment_cache,
+    **{f'export_{fmt}': cache for fmt, cache in export_caches.items()}
+}))
+
+# Endpoint de métricas en formato de texto de Prometheus
+@bp.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
 # Health check endpoint para producción
-@app.route('/health')
+@bp.route('/health')
 def health_check():
     return jsonify({
         "status": "healthy",
@@ -130,8 +188,74 @@ def health_check():
         "environment": "streamlit_cloud" if is_streamlit_cloud() else "local"
     })
 
+def _stream_and_persist(text, lang, speed, filepath, filename, engine=None, post=None):
+    """Reenviar el audio al cliente mientras se guarda en disco e historial"""
+    # Si el cliente se desconecta o falla el motor no quedan archivos a medias
+    with storage.atomic_open(filepath) as f:
+        for chunk in synthesize_stream(text, lang, speed, engine=engine, post=post):
+            f.write(chunk)
+            yield chunk
+    storage_janitor.track(filepath)
+    save_to_history(text, lang, filename, filepath)
+
+def upstream_error_response(error):
+    """Respuesta ante fallos del servicio TTS: 503 con Retry-After si el circuito está abierto"""
+    if isinstance(error, UpstreamUnavailable):
+        response = jsonify({"error": str(error), "retry_after": error.retry_after})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(error.retry_after)
+        return response
+    current_app.logger.error(f"Error del servicio TTS: {str(error)}")
+    return jsonify({"error": "El servicio de síntesis no respondió, intente de nuevo"}), 502
+
+# Expandir idiomas soportados
+SUPPORTED_LANGUAGES = {
+    'es': 'Spanish',
+    'en': 'English', 
+    'fr': 'French',
+    'de': 'German',
+    'it': 'Italian',
+    'pt': 'Portuguese',
+    'ru': 'Russian',
+    'ja': 'Japanese',
+    'ko': 'Korean',
+    'zh': 'Chinese'
+}
+
+MAX_TEXT_LENGTH = 5000
+
+def parse_audio_request(data):
+    """Validar los parámetros de síntesis; devuelve (text, lang, speed, error)"""
+    text = data.get('text', '').strip()
+    lang = data.get('lang', 'es')
+    
+    # Nuevos parámetros de configuración
+    speed = data.get('speed', 1.0)  # Velocidad de habla
+    voice_type = data.get('voice_type', 'default')  # Tipo de voz
+    
+    # Validaciones
+    if not text:
+        return text, lang, speed, "El texto no puede estar vacío."
+    
+    if len(text) > MAX_TEXT_LENGTH:  # Límite de caracteres
+        return text, lang, speed, f"El texto es demasiado largo (máximo {MAX_TEXT_LENGTH} caracteres)."
+    
+    if lang not in SUPPORTED_LANGUAGES:
+        return text, lang, speed, f"Idioma no soportado. Idiomas disponibles: {list(SUPPORTED_LANGUAGES.keys())}"
+        
+    # Validar velocidad
+    if not 0.5 <= speed <= 2.0:
+        return text, lang, speed, "La velocidad debe estar entre 0.5 y 2.0"
+    
+    # Motor de síntesis: 'auto' aplica la ruta por idioma y el respaldo
+    if data.get('engine', 'auto') not in engine_choices():
+        return text, lang, speed, f"Motor no soportado. Motores disponibles: {engine_choices()}"
+    
+    return text, lang, speed, None
+
 # Endpoint para generar audio con validaciones mejoradas
-@app.route('/generate_audio', methods=['POST'])
+@bp.route('/generate_audio', methods=['POST'])
+@admission_required()
 def generate_audio():
     try:
         # Validar Content-Type
@@ -142,102 +266,224 @@ def generate_audio():
         if not data:
             return jsonify({"error": "No se recibieron datos JSON válidos"}), 400
         
-        text = data.get('text', '').strip()
-        lang = data.get('lang', 'es')
+        text, lang, speed, error = parse_audio_request(data)
+        if error:
+            return jsonify({"error": error}), 400
         
-        # Nuevos parámetros de configuración
-        speed = data.get('speed', 1.0)  # Velocidad de habla
-        voice_type = data.get('voice_type', 'default')  # Tipo de voz
-        
-        # Validaciones
-        if not text:
-            return jsonify({"error": "El texto no puede estar vacío."}), 400
-        
-        if len(text) > 5000:  # Límite de caracteres
-            return jsonify({"error": "El texto es demasiado largo (máximo 5000 caracteres)."}), 400
-        
-        # Expandir idiomas soportados
-        supported_languages = {
-            'es': 'Spanish',
-            'en': 'English', 
-            'fr': 'French',
-            'de': 'German',
-            'it': 'Italian',
-            'pt': 'Portuguese',
-            'ru': 'Russian',
-            'ja': 'Japanese',
-            'ko': 'Korean',
-            'zh': 'Chinese'
-        }
-        
-        if lang not in supported_languages:
-            return jsonify({"error": f"Idioma no soportado. Idiomas disponibles: {list(supported_languages.keys())}"}), 400
+        # Nombre único también entre varios procesos trabajadores
+        unique_filename = storage.unique_filename('tts_audio', 'mp3')
+        unique_filepath = os.path.join(PUBLIC_FOLDER, unique_filename)
             
-        # Validar velocidad
-        if not 0.5 <= speed <= 2.0:
-            return jsonify({"error": "La velocidad debe estar entre 0.5 y 2.0"}), 400
+        engine = data.get('engine')
         
-        # Generar nombre único para evitar conflictos
-        timestamp = int(time.time())
-        unique_filename = f'tts_audio_{timestamp}.mp3'
-        unique_filepath = os.path.join(PUBLIC_FOLDER, unique_filename)
+        # Posprocesado opcional: recorte de silencios, normalización y fundidos
+        post = postprocess.parse_options(data.get('postprocess'))
+        if post and not pcm.available():
+            return jsonify({"error": "El posprocesado de audio requiere ffmpeg"}), 503
             
-        # Configurar gTTS con parámetros avanzados
-        tts = gTTS(text=text, lang=lang, slow=(speed < 0.8))
-        tts.save(unique_filepath)
+        # Modo streaming: enviar cada fragmento MP3 en cuanto lo produce el motor
+        if data.get('stream'):
+            return Response(
+                _stream_and_persist(text, lang, speed, unique_filepath, unique_filename, engine, post),
+                mimetype='audio/mpeg'
+            )
+            
+        # Sintetizar (o servir desde la caché) con parámetros avanzados
+        synthesize_to_file(text, lang, unique_filepath, speed=speed, engine=engine, post=post)
+        storage_janitor.track(unique_filepath)
         
         # Guardar en historial
-        save_to_history(text, lang, unique_filename)
+        save_to_history(text, lang, unique_filename, unique_filepath)
         
-        return send_file(unique_filepath, mimetype='audio/mpeg', as_attachment=False)
+        # El archivo tiene nombre único: se puede cachear sin caducidad y
+        # reproducirlo después desde su URL con hash de contenido
+        response = send_cached(unique_filepath, immutable=True, mimetype='audio/mpeg', as_attachment=False)
+        response.headers['X-Audio-URL'] = audio_url(unique_filepath)
+        return response
         
+    except UpstreamError as e:
+        return upstream_error_response(e)
+    except EngineError as e:
+        return jsonify({"error": str(e)}), 503
     except ValueError as e:
         return jsonify({"error": f"Error de datos: {str(e)}"}), 400
     except Exception as e:
-        app.logger.error(f"Error generando audio: {str(e)}")
+        current_app.logger.error(f"Error generando audio: {str(e)}")
         return jsonify({"error": "Error interno del servidor"}), 500
 
-@app.route('/generate_batch_audio', methods=['POST'])
+def _batch_zip_entries(items, lang, engine=None):
+    """Producir entradas del ZIP en el orden en que terminan los elementos"""
+    timestamp = int(time.time())
+    futures = submit_batch([text for _, text in items], lang, engine=engine)
+    # Los textos repetidos comparten future: un resultado, varias entradas
+    pending = {}
+    for (i, _), future in zip(items, futures):
+        pending.setdefault(future, []).append(i)
+    errors = []
+    
+    for future in as_completed(pending):
+        for i in pending[future]:
+            try:
+                yield f"batch_audio_{i+1}_{timestamp}.mp3", future.result()
+            except Exception as e:
+                errors.append({'index': i+1, 'error': str(e)})
+    
+    # Los fallos por elemento se informan dentro del propio ZIP
+    if errors:
+        errors.sort(key=lambda e: e['index'])
+        yield 'errors.json', json.dumps(errors, ensure_ascii=False).encode('utf-8')
+
+# Eventos de progreso: una línea JSON por evento (NDJSON) o Server-Sent Events
+EVENT_MIMETYPES = {'ndjson': 'application/x-ndjson', 'sse': 'text/event-stream'}
+
+def _event_format(data=None, default=None):
+    """Formato pedido con "events" / ?events= o, si no, con la cabecera Accept"""
+    fmt = (data or {}).get('events') or request.args.get('events')
+    if fmt is None:
+        accept = request.headers.get('Accept', '')
+        if 'text/event-stream' in accept:
+            fmt = 'sse'
+        elif 'application/x-ndjson' in accept:
+            fmt = 'ndjson'
+        else:
+            fmt = default
+    return fmt
+
+def _format_event(event, fmt):
+    payload = json.dumps(event, ensure_ascii=False)
+    if fmt == 'sse':
+        return f"event: {event['event']}\ndata: {payload}\n\n"
+    return payload + '\n'
+
+def _event_response(events, fmt):
+    # Los generadores de eventos usan current_app (registro de errores):
+    # el contexto de la petición se mantiene mientras se envía el cuerpo
+    return Response(
+        stream_with_context(_format_event(event, fmt) for event in events),
+        mimetype=EVENT_MIMETYPES[fmt],
+        # Sin búfer en proxies (nginx) para que cada evento llegue al instante
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def _batch_events(items, lang, engine=None):
+    """Eventos de un lote: cada audio se guarda y se anuncia en cuanto está listo"""
+    start = time.perf_counter()
+    timestamp = int(time.time())
+    stored = []
+    errors = []
+    try:
+        for event in synthesize_batch_events([text for _, text in items], lang, engine=engine):
+            i, text = items[event['index']]
+            event['index'] = i + 1
+            data = event.pop('data', None)
+            if event['event'] == 'queued':
+                event['text_preview'] = text[:50] + '...' if len(text) > 50 else text
+            elif event['event'] == 'failed':
+                errors.append({'index': i + 1, 'error': event['error']})
+            yield event
+            
+            if data is not None:
+                store_start = time.perf_counter()
+                filename = storage.unique_filename('batch_audio', 'mp3')
+                filepath = os.path.join(PUBLIC_FOLDER, filename)
+                storage.atomic_write(filepath, data)
+                storage_janitor.track(filepath)
+                stored.append((i, filepath))
+                yield {
+                    'event': 'stored', 'index': i + 1, 'filename': filename,
+                    'audio_url': audio_url(filepath),
+                    'store_ms': round((time.perf_counter() - store_start) * 1000, 3),
+                    'elapsed_ms': round((time.perf_counter() - start) * 1000, 3)
+                }
+        
+        # El ZIP completo queda disponible en /download_batch como en el modo normal
+        zip_filename = None
+        if stored:
+            zip_filename = storage.unique_filename('batch_audio', 'zip')
+            zip_filepath = os.path.join(PUBLIC_FOLDER, zip_filename)
+            with metrics.stage('zip'), storage.atomic_open(zip_filepath) as f, zipfile.ZipFile(f, 'w') as zip_file:
+                for i, filepath in sorted(stored):
+                    zip_file.write(filepath, f"batch_audio_{i+1}_{timestamp}.mp3")
+            storage_janitor.track(zip_filepath)
+        errors.sort(key=lambda e: e['index'])
+        yield {
+            'event': 'done', 'success': bool(stored), 'total': len(stored), 'errors': errors,
+            'zip_file': zip_filename, 'elapsed_ms': round((time.perf_counter() - start) * 1000, 3)
+        }
+    except Exception as e:
+        current_app.logger.error(f"Error en lote con eventos: {str(e)}")
+        yield {'event': 'error', 'error': str(e)}
+
+def _batch_cost():
+    """Un lote consume un token por texto (cada uno es una llamada a gTTS)"""
+    texts = (request.get_json(silent=True) or {}).get('texts')
+    return max(1, len(texts)) if isinstance(texts, list) else 1
+
+@bp.route('/generate_batch_audio', methods=['POST'])
+@admission_required(cost=_batch_cost)
 def generate_batch_audio():
     try:
         data = request.get_json()
         texts = data.get('texts', [])
         lang = data.get('lang', 'es')
+        engine = data.get('engine')
         
         if not texts or len(texts) > 10:
             return jsonify({"error": "Debe proporcionar entre 1 y 10 textos"}), 400
         
+        if engine not in (None, *engine_choices()):
+            return jsonify({"error": f"Motor no soportado. Motores disponibles: {engine_choices()}"}), 400
+        
+        items = [(i, text.strip()) for i, text in enumerate(texts) if text.strip()]
+        
+        # Progreso en vivo: eventos NDJSON o SSE por elemento (encolado,
+        # sintetizado, guardado) con sus tiempos
+        events = _event_format(data)
+        if events:
+            if events not in EVENT_MIMETYPES:
+                return jsonify({"error": f"Formato de eventos no soportado. Formatos disponibles: {list(EVENT_MIMETYPES)}"}), 400
+            return _event_response(_batch_events(items, lang, engine), events)
+        
+        # Modo streaming: el ZIP se envía por fragmentos sin pasar por disco
+        if data.get('stream') or request.args.get('stream') == '1':
+            zip_filename = f"batch_audio_{int(time.time())}.zip"
+            return Response(
+                stream_zip(_batch_zip_entries(items, lang, engine)),
+                mimetype='application/zip',
+                headers={'Content-Disposition': f'attachment; filename={zip_filename}'}
+            )
+        
         audio_files = []
-        zip_filename = f"batch_audio_{int(time.time())}.zip"
+        errors = []
+        zip_filename = storage.unique_filename('batch_audio', 'zip')
         zip_filepath = os.path.join(PUBLIC_FOLDER, zip_filename)
         
-        with zipfile.ZipFile(zip_filepath, 'w') as zip_file:
-            for i, text in enumerate(texts):
-                if len(text.strip()) == 0:
+        # Sintetizar en paralelo conservando el índice original de cada texto
+        results = synthesize_batch([text for _, text in items], lang, engine=engine)
+        
+        with metrics.stage('zip'), storage.atomic_open(zip_filepath) as f, zipfile.ZipFile(f, 'w') as zip_file:
+            for (i, text), (audio_bytes, error) in zip(items, results):
+                if error is not None:
+                    errors.append({'index': i+1, 'error': str(error)})
                     continue
                     
                 filename = f"batch_audio_{i+1}_{int(time.time())}.mp3"
-                filepath = os.path.join(PUBLIC_FOLDER, filename)
-                
-                tts = gTTS(text=text.strip(), lang=lang)
-                tts.save(filepath)
                 
-                # Agregar al ZIP
-                zip_file.write(filepath, filename)
+                # Agregar al ZIP directamente desde memoria
+                zip_file.writestr(filename, audio_bytes)
                 
                 audio_files.append({
                     'index': i+1,
                     'filename': filename,
                     'text_preview': text[:50] + '...' if len(text) > 50 else text
                 })
-                
-                # Limpiar archivo temporal
-                os.remove(filepath)
+        storage_janitor.track(zip_filepath)
         
         return jsonify({
-            "success": True,
+            "success": bool(audio_files),
             "files": audio_files,
             "total": len(audio_files),
+            "errors": errors,
             "zip_file": zip_filename
         })
         
@@ -245,41 +491,242 @@ def generate_batch_audio():
         return jsonify({"error": str(e)}), 500
 
 # Endpoint para descargar archivo ZIP de lote
-@app.route('/download_batch/<filename>')
+@bp.route('/download_batch/<filename>')
 def download_batch(filename):
     try:
-        filepath = os.path.join(PUBLIC_FOLDER, filename)
-        if os.path.exists(filepath):
-            return send_file(filepath, as_attachment=True)
+        filepath = safe_join(PUBLIC_FOLDER, filename)
+        if filepath and os.path.isfile(filepath):
+            return send_cached(filepath, immutable=True, as_attachment=True)
         else:
             return jsonify({"error": "Archivo no encontrado"}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/history', methods=['GET'])
+# Cola de trabajos asíncrona (persistente en tts_history.db)
+def _run_audio_job(payload, job):
+    """Procesar un trabajo de síntesis en un trabajador de la cola"""
+    filename = f"tts_audio_{job.id}.mp3"
+    filepath = os.path.join(PUBLIC_FOLDER, filename)
+    synthesize_to_file(payload['text'], payload['lang'], filepath, speed=payload['speed'],
+                       engine=payload.get('engine'))
+    storage_janitor.track(filepath)
+    save_to_history(payload['text'], payload['lang'], filename, filepath)
+    return {'filename': filename}
+
+def _run_long_audio_job(payload, job):
+    """Procesar un documento largo informando el progreso de forma periódica"""
+    filename = f"tts_long_{job.id}.mp3"
+    filepath = os.path.join(PUBLIC_FOLDER, filename)
+    last_report = [0.0]
+    
+    def report(progress):
+        now = time.monotonic()
+        if now - last_report[0] >= 0.5:
+            job.report_progress(progress)
+            last_report[0] = now
+    
+    synthesize_document(payload['input_path'], payload['lang'], filepath,
+                        speed=payload['speed'], on_progress=report, engine=payload.get('engine'))
+    storage_janitor.track(filepath)
+    save_to_history(payload['preview'], payload['lang'], filename, filepath)
+    
+    # El texto de entrada ya no es necesario
+    if os.path.exists(payload['input_path']):
+        os.remove(payload['input_path'])
+    return {'filename': filename}
+
+job_queue = JobQueue()
+job_queue.register('audio', _run_audio_job)
+job_queue.register('long_audio', _run_long_audio_job)
+
+# Los trabajos se sintetizan fuera de la petición: solo aplica el límite de tasa
+@bp.route('/jobs', methods=['POST'])
+@admission_required(limit_concurrency=False)
+def create_job():
+    try:
+        if not request.is_json:
+            return jsonify({"error": "Content-Type debe ser application/json"}), 400
+        
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No se recibieron datos JSON válidos"}), 400
+        
+        text, lang, speed, error = parse_audio_request(data)
+        if error:
+            return jsonify({"error": error}), 400
+        
+        job_id = job_queue.submit('audio', {'text': text, 'lang': lang, 'speed': speed, 'engine': data.get('engine')})
+        return jsonify({
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/jobs/{job_id}",
+            "events_url": f"/jobs/{job_id}/events"
+        }), 202
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+MAX_DOCUMENT_BYTES = int(os.environ.get('TTS_MAX_DOCUMENT_BYTES', 5 * 1024 * 1024))
+
+@bp.route('/generate_long_audio', methods=['POST'])
+@admission_required(limit_concurrency=False)
+def generate_long_audio():
+    """Encolar la síntesis de un documento largo (texto JSON o archivo subido)"""
+    try:
+        upload = request.files.get('file')
+        if upload:
+            params = request.form
+        elif request.is_json and request.get_json():
+            params = request.get_json()
+        else:
+            return jsonify({"error": "Envíe un JSON con 'text' o un archivo en el campo 'file'"}), 400
+        
+        lang = params.get('lang', 'es')
+        speed = float(params.get('speed', 1.0))
+        engine = params.get('engine')
+        
+        if lang not in SUPPORTED_LANGUAGES:
+            return jsonify({"error": f"Idioma no soportado. Idiomas disponibles: {list(SUPPORTED_LANGUAGES.keys())}"}), 400
+        
+        if not 0.5 <= speed <= 2.0:
+            return jsonify({"error": "La velocidad debe estar entre 0.5 y 2.0"}), 400
+        
+        if engine not in (None, *engine_choices()):
+            return jsonify({"error": f"Motor no soportado. Motores disponibles: {engine_choices()}"}), 400
+        
+        # El documento se guarda en disco para que el trabajador lo lea por bloques
+        input_path = os.path.join(UPLOAD_FOLDER, f"document_{uuid.uuid4().hex}.txt")
+        if upload:
+            upload.save(input_path)
+        else:
+            with open(input_path, 'w', encoding='utf-8') as f:
+                f.write(params.get('text', ''))
+        
+        size = os.path.getsize(input_path)
+        if size > MAX_DOCUMENT_BYTES:
+            os.remove(input_path)
+            return jsonify({"error": f"El documento es demasiado grande (máximo {MAX_DOCUMENT_BYTES} bytes)."}), 413
+        
+        with open(input_path, 'r', encoding='utf-8', errors='replace') as f:
+            preview = f.read(200).strip()
+        if not preview:
+            os.remove(input_path)
+            return jsonify({"error": "El texto no puede estar vacío."}), 400
+        
+        job_id = job_queue.submit('long_audio', {
+            'input_path': input_path,
+            'lang': lang,
+            'speed': speed,
+            'engine': engine,
+            'preview': preview + '...' if size > 200 else preview
+        })
+        return jsonify({
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/jobs/{job_id}",
+            "events_url": f"/jobs/{job_id}/events"
+        }), 202
+        
+    except ValueError as e:
+        return jsonify({"error": f"Error de datos: {str(e)}"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    try:
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({"error": "Trabajo no encontrado"}), 404
+        if job['status'] == 'done':
+            job['result_url'] = f"/jobs/{job_id}/result"
+        return jsonify(job)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def _job_events(job_id, poll_interval=0.5):
+    """Emitir el estado del trabajo cada vez que cambia, hasta que termina"""
+    last = None
+    while True:
+        job = job_queue.get(job_id)
+        if job is None:
+            yield {'event': 'error', 'error': "Trabajo no encontrado"}
+            return
+        state = (job['status'], job['progress'])
+        if state != last:
+            last = state
+            event = {'event': 'progress', 'job_id': job_id, 'status': job['status'], 'progress': job['progress']}
+            if job['status'] == 'done':
+                event.update(event='done', result=job['result'], result_url=f"/jobs/{job_id}/result")
+            elif job['status'] == 'failed':
+                event.update(event='failed', error=job['error'])
+            yield event
+            if job['status'] in ('done', 'failed'):
+                return
+        time.sleep(poll_interval)
+
+# Progreso en vivo de un trabajo (SSE por defecto, compatible con EventSource)
+@bp.route('/jobs/<job_id>/events', methods=['GET'])
+def get_job_events(job_id):
+    try:
+        if job_queue.get(job_id) is None:
+            return jsonify({"error": "Trabajo no encontrado"}), 404
+        events = _event_format(default='sse')
+        if events not in EVENT_MIMETYPES:
+            return jsonify({"error": f"Formato de eventos no soportado. Formatos disponibles: {list(EVENT_MIMETYPES)}"}), 400
+        return _event_response(_job_events(job_id), events)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    try:
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({"error": "Trabajo no encontrado"}), 404
+        if job['status'] != 'done':
+            return jsonify({"error": "El trabajo aún no ha terminado", "status": job['status']}), 409
+        
+        filepath = os.path.join(PUBLIC_FOLDER, job['result']['filename'])
+        if not os.path.exists(filepath):
+            return jsonify({"error": "Archivo no encontrado"}), 404
+        return send_cached(filepath, immutable=True, mimetype='audio/mpeg', as_attachment=False)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/history', methods=['GET'])
 def get_history():
     try:
-        conn = sqlite3.connect('tts_history.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM audio_history ORDER BY created_at DESC LIMIT 50')
-        history = cursor.fetchall()
-        conn.close()
+        # Paginación por cursor: ?cursor=<id de la última fila recibida>
+        limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+        cursor = request.args.get('cursor', type=int)
+        favorites_only = request.args.get('favorites') in ('1', 'true')
+        query = request.args.get('q')
+        
+        history = db.get_history(limit, before_id=cursor, favorites_only=favorites_only, query=query)
         
-        return jsonify([{
+        response = jsonify([{
             'id': h[0], 'text': h[1], 'language': h[2], 
-            'filename': h[3], 'created_at': h[4], 'is_favorite': h[5]
+            'filename': h[3], 'created_at': h[4], 'is_favorite': h[5],
+            'file_available': h[6],
+            # Solo con el hash guardado al escribir: el listado no toca el disco
+            'audio_url': audio_url(h[3], h[7]) if h[6] and h[7] else None
         } for h in history])
+        
+        # El cursor de la siguiente página viaja en una cabecera para no
+        # cambiar el formato de la respuesta
+        if len(history) == limit:
+            response.headers['X-Next-Cursor'] = str(history[-1][0])
+        return response
+    except ValueError as e:
+        return jsonify({"error": f"Error de datos: {str(e)}"}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/toggle_favorite/<int:audio_id>', methods=['POST'])
+@bp.route('/toggle_favorite/<int:audio_id>', methods=['POST'])
 def toggle_favorite(audio_id):
     try:
-        conn = sqlite3.connect('tts_history.db')
-        cursor = conn.cursor()
-        cursor.execute('UPDATE audio_history SET is_favorite = NOT is_favorite WHERE id = ?', (audio_id,))
-        conn.commit()
-        conn.close()
+        db.toggle_favorite(audio_id)
         
         return jsonify({"success": True})
     except Exception as e:
@@ -294,43 +741,42 @@ TEMPLATES = {
     'farewell': "Gracias por usar nuestro servicio. ¡Hasta pronto!"
 }
 
-@app.route('/templates', methods=['GET'])
+# Plantillas y textos frecuentes se sintetizan en segundo plano al arrancar
+cache_warmer = CacheWarmer(TEMPLATES.values(), SUPPORTED_LANGUAGES)
+
+@bp.route('/templates', methods=['GET'])
 def get_templates():
     return jsonify(TEMPLATES)
 
 # Endpoint para información del sistema
-@app.route('/system_info', methods=['GET'])
+@bp.route('/system_info', methods=['GET'])
 def system_info():
     return jsonify({
         "status": "online",
         "version": "1.0.0",
         "environment": "streamlit_cloud" if is_streamlit_cloud() else "local",
-        "supported_languages": list({
-            'es': 'Spanish',
-            'en': 'English', 
-            'fr': 'French',
-            'de': 'German',
-            'it': 'Italian',
-            'pt': 'Portuguese',
-            'ru': 'Russian',
-            'ja': 'Japanese',
-            'ko': 'Korean',
-            'zh': 'Chinese'
-        }.keys()),
-        "max_text_length": 5000,
-        "max_batch_size": 10
+        "supported_languages": list(SUPPORTED_LANGUAGES.keys()),
+        "max_text_length": MAX_TEXT_LENGTH,
+        "max_batch_size": 10,
+        "cache": audio_cache.stats(),
+        "segment_cache": segment_cache.stats(),
+        "export_cache": {fmt: cache.stats() for fmt, cache in export_caches.items()},
+        "upstream": {"circuit": upstream_client.breaker.state},
+        "engines": engines_info(),
+        "warmup": cache_warmer.stats()
     })
 
 # Manejo de errores globales
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found(error):
     return jsonify({"error": "Recurso no encontrado"}), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def server_error(error):
     return jsonify({"error": "Error interno del servidor"}), 500
 
-@app.route('/export_audio', methods=['POST'])
+@bp.route('/export_audio', methods=['POST'])
+@admission_required()
 def export_audio():
     try:
         data = request.get_json()
@@ -341,33 +787,23 @@ def export_audio():
         if not audio_file:
             return jsonify({"error": "No se especificó archivo de audio"}), 400
             
-        if format_type not in ['mp3', 'wav', 'ogg']:
+        if format_type not in EXPORT_FORMATS:
             return jsonify({"error": "Formato no soportado"}), 400
         
+        try:
+            post = postprocess.parse_options(data.get('postprocess'))
+        except ValueError as e:
+            return jsonify({"error": f"Error de datos: {str(e)}"}), 400
+        
         source_path = os.path.join(PUBLIC_FOLDER, audio_file)
         if not os.path.exists(source_path):
             return jsonify({"error": "Archivo de audio no encontrado"}), 404
             
-        # Cargar audio con pydub
-        audio = AudioSegment.from_mp3(source_path)
-        
-        # Configurar parámetros de exportación
-        export_params = {}
-        
-        if format_type == 'mp3':
-            bitrate = '64k' if quality == 'low' else '128k' if quality == 'medium' else '192k'
-            export_params = {'format': 'mp3', 'bitrate': bitrate}
-        elif format_type == 'wav':
-            export_params = {'format': 'wav'}
-        elif format_type == 'ogg':
-            export_params = {'format': 'ogg', 'codec': 'libvorbis'}
+        # Transcodificar con pydub solo si la variante no está en caché
+        exported_path, key = transcode(source_path, format_type, quality, post)
         
-        # Exportar archivo
-        timestamp = int(time.time())
-        exported_filename = f"audio_export_{timestamp}.{format_type}"
-        exported_path = os.path.join(PUBLIC_FOLDER, exported_filename)
-        
-        audio.export(exported_path, **export_params)
+        # Nombre determinista derivado de origen + formato + calidad
+        exported_filename = f"audio_export_{key[:16]}.{format_type}"
         
         return send_file(exported_path, as_attachment=True, download_name=exported_filename)
         
@@ -375,7 +811,7 @@ def export_audio():
         return jsonify({"error": str(e)}), 500
 
 # Función para ejecutar Flask en modo compatible con Streamlit Cloud
-def run_flask_app():
+def run_flask_app(app):
     """Ejecutar Flask de manera segura en diferentes entornos"""
     
     # Configurar manejador de señales seguro
@@ -407,18 +843,69 @@ def run_flask_app():
             threaded=True
         )
 
-if __name__ == "__main__":
-    print("🚀 Iniciando Text-to-Speech Platform...")
-    
+def start_background_services():
+    """Arrancar los servicios del proceso actual (una vez por trabajador)"""
     # Inicializar base de datos
     init_db()
     
-    # Limpiar archivos antiguos
-    cleanup_old_files()
+    # Limpiar archivos antiguos en segundo plano de forma periódica
+    storage_janitor.start()
+    
+    # Reanudar trabajos pendientes de una ejecución anterior
+    job_queue.ensure_started()
+    
+    # Precalentar la caché sin retrasar el arranque del servidor
+    cache_warmer.start()
+
+def create_app(config_name=None):
+    """Crear la aplicación Flask con la configuración de config.py
+
+    config_name es una clave de config (development, production, testing);
+    por defecto se toma de FLASK_CONFIG. Las dependencias pesadas (pydub,
+    NumPy, gTTS, requests) no se importan aquí sino en la primera petición
+    que las necesita. En modo testing no se arrancan hilos en segundo plano.
+    """
+    config_name = config_name or os.environ.get('FLASK_CONFIG', 'default')
+    if config_name not in config:
+        raise ValueError(f"Configuración desconocida: {config_name}")
+    
+    app = Flask(__name__)
+    app.config.from_object(config[config_name])
+    
+    # Crear directorios si no existen
+    os.makedirs(PUBLIC_FOLDER, exist_ok=True)
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    
+    app.register_blueprint(bp)
+    if not app.testing:
+        start_background_services()
+    return app
+
+_default_app = None
+_default_app_lock = threading.Lock()
+
+def __getattr__(name):
+    """main_flask.app: aplicación por defecto creada en el primer acceso
+
+    Mantiene funcionando "gunicorn main_flask:app" y el código que importa
+    app sin que importar el módulo tenga efectos secundarios.
+    """
+    global _default_app
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _default_app_lock:
+        if _default_app is None:
+            _default_app = create_app()
+        return _default_app
+
+if __name__ == "__main__":
+    print("🚀 Iniciando Text-to-Speech Platform...")
+    
+    app = create_app()
     
     print(f"📁 Carpeta estática: {STATIC_FOLDER}")
     print(f"🎵 Carpeta pública: {PUBLIC_FOLDER}")
     print("="*50)
     
     # Ejecutar aplicación
-    run_flask_app()
\ No newline at end of file
+    run_flask_app(app)
\ No newline at end of file
@@ -0,0 +1,171 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Límites (segundos) de los histogramas de latencia
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(n, '') for n in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [conteos por límite (sin acumular), suma, total]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (counts, total_sum, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {total_sum}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+class Registry:
+    """Conjunto de métricas en proceso expuestas en formato de texto de Prometheus"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """Registrar una función que devuelve líneas calculadas al exportar"""
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                lines.append(f'# Error en colector: {_escape(e)}')
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.register(Counter(
+    'tts_http_requests_total', 'Peticiones HTTP atendidas', ('route', 'method', 'status')))
+HTTP_LATENCY = registry.register(Histogram(
+    'tts_http_request_duration_seconds', 'Latencia de las peticiones HTTP', ('route', 'method')))
+HTTP_IN_FLIGHT = registry.register(Gauge(
+    'tts_http_requests_in_flight', 'Peticiones HTTP en curso', ('route',)))
+STAGE_LATENCY = registry.register(Histogram(
+    'tts_stage_duration_seconds', 'Duración de cada etapa del pipeline', ('stage',)))
+STAGE_IN_FLIGHT = registry.register(Gauge(
+    'tts_stage_in_flight', 'Operaciones en curso por etapa del pipeline', ('stage',)))
+
+@contextmanager
+def stage(name):
+    """Medir una etapa del pipeline (synthesis, save, history_insert, zip, transcode)"""
+    STAGE_IN_FLIGHT.inc(stage=name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - start, stage=name)
+        STAGE_IN_FLIGHT.dec(stage=name)
+
+def cache_collector(caches):
+    """Colector de aciertos, fallos y ratio; caches() devuelve {nombre: AudioCache}"""
+    def collect():
+        lines = [
+            '# HELP tts_cache_hits_total Aciertos de caché',
+            '# TYPE tts_cache_hits_total counter',
+        ]
+        stats = {name: cache.stats() for name, cache in caches().items()}
+        lines += [f'tts_cache_hits_total{{cache="{n}"}} {s["hits"]}' for n, s in stats.items()]
+        lines += ['# HELP tts_cache_misses_total Fallos de caché', '# TYPE tts_cache_misses_total counter']
+        lines += [f'tts_cache_misses_total{{cache="{n}"}} {s["misses"]}' for n, s in stats.items()]
+        lines += ['# HELP tts_cache_hit_ratio Ratio de aciertos de caché', '# TYPE tts_cache_hit_ratio gauge']
+        lines += [f'tts_cache_hit_ratio{{cache="{n}"}} {s["hit_ratio"]}' for n, s in stats.items()]
+        lines += ['# HELP tts_cache_size_bytes Tamaño de la caché en disco', '# TYPE tts_cache_size_bytes gauge']
+        lines += [f'tts_cache_size_bytes{{cache="{n}"}} {s["size_bytes"]}' for n, s in stats.items()]
+        return lines
+    return collect
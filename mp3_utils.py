@@ -0,0 +1,130 @@
+import re
+import unicodedata
+
+# Tablas de bitrate (kbps) indexadas por (versión MPEG, capa)
+_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+# Frecuencias de muestreo indexadas por bits de versión del encabezado
+_SAMPLE_RATES = {
+    0b11: (44100, 48000, 32000),  # MPEG 1
+    0b10: (22050, 24000, 16000),  # MPEG 2
+    0b00: (11025, 12000, 8000),   # MPEG 2.5
+}
+
+# Separador de oraciones: puntuación final seguida de espacio o salto de línea
+_SENTENCE_RE = re.compile(r'(?<=[.!?…;:])\s+|\n+')
+
+def is_speakable(segment):
+    """Hay algo que pronunciar: no solo puntuación ("...", "…", "—") ni espacios
+
+    gTTS elimina la puntuación antes de enviar el texto y falla si no queda nada.
+    """
+    return any(not c.isspace() and not unicodedata.category(c).startswith('P') for c in segment)
+
+def split_sentences(text):
+    """Dividir texto en oraciones conservando la puntuación"""
+    return [s.strip() for s in _SENTENCE_RE.split(text) if is_speakable(s)]
+
+def iter_sentences(stream, chunk_size=64 * 1024, max_sentence=1000):
+    """Leer texto por bloques y emitir oraciones sin cargar el documento entero
+
+    Emite pares (oración, bytes consumidos): el tamaño en UTF-8 del texto
+    leído hasta el final de la oración y su separador, para medir el progreso
+    por oración y no por bloque leído.
+    """
+    pending = ''
+    consumed = 0
+    while True:
+        block = stream.read(chunk_size)
+        pending += block
+        start = 0
+        for match in _SENTENCE_RE.finditer(pending):
+            part = pending[start:match.start()]
+            consumed += len(pending[start:match.end()].encode('utf-8'))
+            start = match.end()
+            if is_speakable(part):
+                yield part.strip(), consumed
+        # La última parte puede estar incompleta hasta el siguiente bloque
+        pending = pending[start:]
+        # Texto sin puntuación: cortar en el último espacio para acotar memoria
+        while len(pending) > max_sentence:
+            cut = pending.rfind(' ', 0, max_sentence)
+            cut = cut if cut > 0 else max_sentence
+            consumed += len(pending[:cut].encode('utf-8'))
+            if is_speakable(pending[:cut]):
+                yield pending[:cut].strip(), consumed
+            pending = pending[cut:]
+        if not block:
+            consumed += len(pending.encode('utf-8'))
+            if is_speakable(pending):
+                yield pending.strip(), consumed
+            return
+
+def _skip_id3v2(data):
+    """Devolver el desplazamiento tras la etiqueta ID3v2 inicial, si existe"""
+    if len(data) >= 10 and data[:3] == b'ID3':
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+def frame_length(header):
+    """Calcular la longitud de una trama a partir de sus 4 bytes de encabezado"""
+    if header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return 0
+    version_bits = (header[1] >> 3) & 0x03
+    layer_bits = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+    if version_bits == 0b01 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return 0
+
+    layer = 4 - layer_bits
+    version = 1 if version_bits == 0b11 else 2
+    bitrate = _BITRATES[(version, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version_bits][rate_index]
+
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4
+    if layer == 3 and version == 2:
+        return 72 * bitrate // sample_rate + padding
+    return 144 * bitrate // sample_rate + padding
+
+def _is_vbr_header(frame):
+    """Detectar tramas de metadatos Xing/Info/VBRI que no contienen audio"""
+    head = bytes(frame[:64])
+    return b'Xing' in head or b'Info' in head or b'VBRI' in head
+
+def iter_frames(data):
+    """Iterar sobre las tramas de audio MPEG de un MP3 como memoryviews"""
+    view = memoryview(data)
+    end = len(data)
+    if end >= 128 and view[end - 128:end - 125] == b'TAG':
+        end -= 128
+    pos = _skip_id3v2(data)
+    first = True
+    while pos + 4 <= end:
+        length = frame_length(view[pos:pos + 4])
+        if length == 0 or pos + length > end:
+            # Byte basura entre tramas: resincronizar
+            pos += 1
+            continue
+        frame = view[pos:pos + length]
+        if not (first and _is_vbr_header(frame)):
+            yield frame
+        first = False
+        pos += length
+
+def concat_mp3(segments):
+    """Concatenar varios MP3 a nivel de trama sin decodificar ni recodificar"""
+    if len(segments) == 1:
+        return bytes(segments[0])
+    return b''.join(frame for segment in segments for frame in iter_frames(segment))
@@ -0,0 +1,54 @@
+import io
+import wave
+import shutil
+import subprocess
+from functools import lru_cache
+
+# NumPy y pydub se importan en la primera decodificación: la API arranca sin
+# cargarlos y las peticiones que no procesan audio nunca los necesitan
+
+@lru_cache(maxsize=None)
+def available():
+    """Decodificar y codificar MP3 requiere ffmpeg (o avconv)"""
+    return bool(shutil.which('ffmpeg') or shutil.which('avconv'))
+
+def decode(source, format='mp3'):
+    """Decodificar audio a PCM mono de 16 bits; devuelve (muestras, frecuencia)
+
+    source puede ser bytes o una ruta. Las muestras son una vista int16
+    escribible sobre un único búfer, de modo que las etapas posteriores
+    trabajan in situ sin copias adicionales.
+    """
+    import numpy as np
+    from pydub import AudioSegment
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    audio = AudioSegment.from_file(source, format=format).set_channels(1).set_sample_width(2)
+    samples = np.frombuffer(bytearray(audio.raw_data), dtype=np.int16)
+    return samples, audio.frame_rate
+
+def encode(samples, frame_rate, format='mp3', bitrate=None, codec=None):
+    """Codificar muestras int16 mono; ffmpeg lee directamente la memoria de la vista"""
+    import numpy as np
+    samples = np.ascontiguousarray(samples, dtype=np.int16)
+    if format == 'wav':
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(frame_rate)
+            wav.writeframes(memoryview(samples).cast('B'))
+        return buffer.getvalue()
+
+    from pydub.utils import get_encoder_name
+    command = [get_encoder_name(), '-hide_banner', '-loglevel', 'error',
+               '-f', 's16le', '-ar', str(frame_rate), '-ac', '1', '-i', 'pipe:0']
+    if codec:
+        command += ['-acodec', codec]
+    if bitrate:
+        command += ['-b:a', bitrate]
+    if format == 'mp3':
+        command += ['-write_xing', '0', '-id3v2_version', '0']
+    command += ['-f', format, 'pipe:1']
+    result = subprocess.run(command, input=memoryview(samples).cast('B'), capture_output=True, check=True)
+    return result.stdout
@@ -0,0 +1,119 @@
+import json
+import pcm
+from metrics import stage
+
+FULL_SCALE = 32767.0
+# Bloque para calcular RMS sin convertir toda la señal a coma flotante a la vez
+_RMS_BLOCK = 1 << 20
+
+def _db_to_amplitude(db):
+    return FULL_SCALE * 10 ** (db / 20.0)
+
+def trim_silence(samples, frame_rate, threshold_db=-50.0, padding_ms=50):
+    """Recortar el silencio inicial y final; devuelve una vista, no una copia
+
+    Si toda la señal está por debajo del umbral se devuelve intacta: un audio
+    vacío no se puede codificar como MP3.
+    """
+    import numpy as np
+    threshold = _db_to_amplitude(threshold_db)
+    loud = np.flatnonzero(np.abs(samples) > threshold)
+    if loud.size == 0:
+        return samples
+    padding = int(frame_rate * padding_ms / 1000)
+    return samples[max(loud[0] - padding, 0):loud[-1] + 1 + padding]
+
+def _peak(samples):
+    return max(int(samples.max()), -int(samples.min())) if samples.size else 0
+
+def _rms(samples):
+    import numpy as np
+    total = 0.0
+    for start in range(0, samples.size, _RMS_BLOCK):
+        block = samples[start:start + _RMS_BLOCK].astype(np.float64)
+        total += float(np.dot(block, block))
+    return (total / samples.size) ** 0.5 if samples.size else 0.0
+
+def normalize(samples, frame_rate, mode='peak', target_db=-1.0):
+    """Ajustar la ganancia in situ hasta el pico o RMS objetivo (dBFS), sin saturar"""
+    import numpy as np
+    peak = _peak(samples)
+    if peak == 0:
+        return samples
+    level = peak if mode == 'peak' else _rms(samples)
+    gain = min(_db_to_amplitude(target_db) / level, FULL_SCALE / peak)
+    np.multiply(samples, gain, out=samples, casting='unsafe')
+    return samples
+
+def fade(samples, frame_rate, fade_in_ms=0, fade_out_ms=0):
+    """Aplicar fundidos lineales de entrada y salida in situ"""
+    import numpy as np
+    fade_in = min(int(frame_rate * fade_in_ms / 1000), samples.size)
+    fade_out = min(int(frame_rate * fade_out_ms / 1000), samples.size)
+    if fade_in:
+        head = samples[:fade_in]
+        np.multiply(head, np.linspace(0.0, 1.0, fade_in, dtype=np.float32), out=head, casting='unsafe')
+    if fade_out:
+        tail = samples[samples.size - fade_out:]
+        np.multiply(tail, np.linspace(1.0, 0.0, fade_out, dtype=np.float32), out=tail, casting='unsafe')
+    return samples
+
+def parse_options(spec):
+    """Validar el objeto "postprocess" de una petición
+
+    Devuelve un dict normalizado ({} si no hay procesado) o lanza ValueError.
+    Ejemplo: {"trim": true, "normalize": {"mode": "rms", "target_db": -16},
+    "fade_in_ms": 20, "fade_out_ms": 80}
+    """
+    if not spec:
+        return {}
+    if not isinstance(spec, dict):
+        raise ValueError("'postprocess' debe ser un objeto")
+
+    options = {}
+    trim = spec.get('trim')
+    if trim:
+        trim = trim if isinstance(trim, dict) else {}
+        threshold_db = float(trim.get('threshold_db', -50.0))
+        padding_ms = int(trim.get('padding_ms', 50))
+        if not -96 <= threshold_db <= 0 or not 0 <= padding_ms <= 1000:
+            raise ValueError("trim: threshold_db entre -96 y 0, padding_ms entre 0 y 1000")
+        options['trim'] = {'threshold_db': threshold_db, 'padding_ms': padding_ms}
+
+    norm = spec.get('normalize')
+    if norm:
+        norm = norm if isinstance(norm, dict) else {}
+        mode = norm.get('mode', 'peak')
+        target_db = float(norm.get('target_db', -1.0 if mode == 'peak' else -16.0))
+        if mode not in ('peak', 'rms') or not -60 <= target_db <= 0:
+            raise ValueError("normalize: mode 'peak' o 'rms', target_db entre -60 y 0")
+        options['normalize'] = {'mode': mode, 'target_db': target_db}
+
+    for name in ('fade_in_ms', 'fade_out_ms'):
+        value = int(spec.get(name, 0))
+        if not 0 <= value <= 10000:
+            raise ValueError(f"{name} debe estar entre 0 y 10000")
+        if value:
+            options[name] = value
+    return options
+
+def options_key(options):
+    """Representación canónica de las opciones para las claves de caché"""
+    return json.dumps(options, sort_keys=True, separators=(',', ':')) if options else ''
+
+def apply(samples, frame_rate, options):
+    """Ejecutar el pipeline (recorte, normalización, fundidos) sobre una sola vista"""
+    if 'trim' in options:
+        samples = trim_silence(samples, frame_rate, **options['trim'])
+    if 'normalize' in options:
+        samples = normalize(samples, frame_rate, **options['normalize'])
+    if 'fade_in_ms' in options or 'fade_out_ms' in options:
+        samples = fade(samples, frame_rate, options.get('fade_in_ms', 0), options.get('fade_out_ms', 0))
+    return samples
+
+def process(source, options, format='mp3', bitrate='32k', codec=None):
+    """Decodificar, procesar y codificar; source son bytes MP3 o una ruta"""
+    with stage('postprocess'):
+        samples, frame_rate = pcm.decode(source)
+        samples = apply(samples, frame_rate, options)
+        return pcm.encode(samples, frame_rate, format=format, bitrate=bitrate, codec=codec)
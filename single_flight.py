@@ -0,0 +1,78 @@
+import threading
+import metrics
+
+COALESCED = metrics.registry.register(metrics.Counter(
+    'tts_singleflight_coalesced_total', 'Síntesis que esperaron a una idéntica ya en curso', ('kind',)))
+
+class _Call:
+    """Resultado compartido de una operación en curso"""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self.result = None
+        self.error = None
+        self.abandoned = False
+
+    def wait(self):
+        """Esperar al líder; si abandonó (abandoned), el resultado es None"""
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+class SingleFlight:
+    """Colapsar llamadas simultáneas con la misma clave en una sola ejecución
+
+    La primera llamada (líder) ejecuta la función; las que llegan mientras tanto
+    esperan y reciben el mismo resultado o la misma excepción. Al terminar, la
+    clave se libera y la siguiente llamada vuelve a ejecutar (normalmente ya
+    con la caché caliente).
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """Devolver (call, es_líder); el líder debe llamar a finish()"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                COALESCED.inc(kind=self.kind)
+                return call, False
+            call = self._calls[key] = _Call()
+            return call, True
+
+    def _release(self, key, call):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def finish(self, key, call, result=None, error=None):
+        self._release(key, call)
+        call.result = result
+        call.error = error
+        call._done.set()
+
+    def abandon(self, key, call):
+        """El líder se retiró sin resultado (p. ej. cliente desconectado)"""
+        self._release(key, call)
+        call.abandoned = True
+        call._done.set()
+
+    def do(self, key, fn):
+        while True:
+            call, leader = self.begin(key)
+            if leader:
+                break
+            result = call.wait()
+            if not call.abandoned:
+                return result
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result=result)
+        return result
@@ -0,0 +1,43 @@
+import os
+import time
+import uuid
+import shutil
+import threading
+from contextlib import contextmanager
+
+def unique_id():
+    """Identificador único entre procesos y máquinas: segundos + 64 bits aleatorios"""
+    return f"{int(time.time())}_{uuid.uuid4().hex[:16]}"
+
+def unique_filename(prefix, extension):
+    return f"{prefix}_{unique_id()}.{extension}"
+
+@contextmanager
+def atomic_open(path, mode='wb'):
+    """Escribir en un temporal propio del proceso y renombrarlo al terminar
+
+    Los lectores (y otros trabajadores) nunca ven un archivo a medias: o no
+    existe o está completo. Los temporales acaban en .part, que la limpieza
+    de almacenamiento ignora.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def atomic_write(path, data):
+    with atomic_open(path) as f:
+        f.write(data)
+    return path
+
+def atomic_copy(source_path, path):
+    with open(source_path, 'rb') as src, atomic_open(path) as dst:
+        shutil.copyfileobj(src, dst)
+    return path
@@ -0,0 +1,58 @@
+import os
+import io
+import hashlib
+from audio_cache import AudioCache, file_digest
+from tts_service import CACHE_FOLDER
+from metrics import stage
+import postprocess
+
+EXPORT_FORMATS = ('mp3', 'wav', 'ogg')
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get('TTS_EXPORT_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+
+# Una caché por formato para conservar la extensión de cada variante
+export_caches = {
+    fmt: AudioCache(os.path.join(CACHE_FOLDER, 'exports', fmt), EXPORT_CACHE_MAX_BYTES, suffix=f'.{fmt}')
+    for fmt in EXPORT_FORMATS
+}
+
+def export_params(format_type, quality):
+    """Parámetros de exportación de pydub para un formato y calidad"""
+    if format_type == 'mp3':
+        bitrate = '64k' if quality == 'low' else '128k' if quality == 'medium' else '192k'
+        return {'format': 'mp3', 'bitrate': bitrate}
+    elif format_type == 'wav':
+        return {'format': 'wav'}
+    elif format_type == 'ogg':
+        return {'format': 'ogg', 'codec': 'libvorbis'}
+    raise ValueError(f"Formato no soportado: {format_type}")
+
+def export_key(source_path, format_type, quality, post=None):
+    """Clave de la variante: contenido del origen + formato + calidad (+ posprocesado)"""
+    # La calidad solo afecta al bitrate de MP3
+    quality = quality if format_type == 'mp3' else '-'
+    raw = f"{file_digest(source_path)}\x1f{format_type}\x1f{quality}"
+    if post:
+        raw += f"\x1f{postprocess.options_key(post)}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def transcode(source_path, format_type, quality, post=None):
+    """Devolver (ruta, clave) de la variante exportada, transcodificando solo si falta"""
+    params = export_params(format_type, quality)
+    cache = export_caches[format_type]
+    key = export_key(source_path, format_type, quality, post)
+
+    cached_path = cache.get(key)
+    if cached_path is None:
+        with stage('transcode'):
+            if post:
+                # Recorte, normalización y fundidos sobre el PCM antes de codificar
+                data = postprocess.process(source_path, post, format=params['format'],
+                                           bitrate=params.get('bitrate'), codec=params.get('codec'))
+            else:
+                from pydub import AudioSegment
+                audio = AudioSegment.from_mp3(source_path)
+                buffer = io.BytesIO()
+                audio.export(buffer, **params)
+                data = buffer.getvalue()
+        cached_path = cache.put(key, data)
+    return cached_path, key
@@ -0,0 +1,367 @@
+import os
+import io
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from audio_cache import AudioCache, make_key
+from metrics import stage
+from engines import get_engine, route
+from single_flight import SingleFlight
+import time_stretch
+import postprocess
+import storage
+from mp3_utils import split_sentences, iter_sentences, is_speakable, concat_mp3, iter_frames
+
+# Caché compartida por la API Flask y la aplicación Streamlit
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_FOLDER = os.environ.get('TTS_CACHE_DIR', os.path.join(BASE_DIR, 'cache'))
+
+audio_cache = AudioCache(os.path.join(CACHE_FOLDER, 'tts'))
+segment_cache = AudioCache(os.path.join(CACHE_FOLDER, 'segments'))
+
+# Pool de trabajadores para lotes y límite global de llamadas simultáneas a gTTS
+BATCH_WORKERS = int(os.environ.get('TTS_BATCH_WORKERS', 4))
+MAX_CONCURRENT_SYNTHESIS = int(os.environ.get('TTS_MAX_CONCURRENCY', 8))
+
+_upstream_slots = threading.BoundedSemaphore(MAX_CONCURRENT_SYNTHESIS)
+
+# Peticiones idénticas simultáneas comparten una sola síntesis
+_text_flights = SingleFlight('text')
+_segment_flights = SingleFlight('segment')
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """Crear de forma perezosa el pool compartido de trabajadores"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='tts-batch')
+        return _executor
+
+def _fetch(text, lang, slow, engine):
+    """Llamar al motor de síntesis y devolver los bytes MP3"""
+    buffer = io.BytesIO()
+    with _upstream_slots, stage('synthesis'):
+        for chunk in get_engine(engine).stream(text, lang, slow):
+            buffer.write(chunk)
+    return buffer.getvalue()
+
+def _fetch_stream(text, lang, slow, engine):
+    """Llamar al motor de síntesis y emitir cada fragmento MP3 en cuanto llega"""
+    chunks = get_engine(engine).stream(text, lang, slow)
+    while True:
+        # El cupo global solo se ocupa mientras se espera al motor
+        with _upstream_slots, stage('synthesis'):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+def _with_fallback(text, lang, engine, fn):
+    """Ejecutar fn(motor) sobre la ruta de motores hasta que uno funcione"""
+    names = route(text, lang, engine)
+    for i, name in enumerate(names):
+        try:
+            return fn(name)
+        except Exception as e:
+            if i == len(names) - 1:
+                raise
+            print(f"⚠️ Motor '{name}' falló ({e}); usando '{names[i + 1]}'")
+
+def _speed_plan(speed):
+    """Traducir speed a (slow, factor), donde factor es el estiramiento a aplicar o None"""
+    factor = time_stretch.normalize_speed(speed)
+    if factor is None:
+        return False, None
+    if not time_stretch.available():
+        # Sin ffmpeg solo queda el modo lento de gTTS
+        return factor < 0.8, None
+    return False, factor
+
+def _variant_key(text, lang, slow, engine, factor, post=None):
+    """Clave de caché; cada velocidad y posprocesado es una variante del mismo texto"""
+    extra = []
+    if factor is not None:
+        extra.append(f'speed={factor}')
+    if post:
+        extra.append(f'post={postprocess.options_key(post)}')
+    return make_key(text, lang, slow, engine, *extra)
+
+def _segment(sentence, lang, slow, engine, factor=None):
+    """Sintetizar una oración con un motor concreto usando la caché de segmentos"""
+    key = _variant_key(sentence, lang, slow, engine, factor)
+    data = segment_cache.get_bytes(key)
+    if data is None:
+        data = _segment_flights.do(key, lambda: _fetch_segment(key, sentence, lang, slow, engine, factor))
+    return data
+
+def _fetch_segment(key, sentence, lang, slow, engine, factor):
+    if factor is None:
+        data = _fetch(sentence, lang, slow, engine)
+    else:
+        data = time_stretch.change_speed(_segment(sentence, lang, slow, engine), factor)
+    segment_cache.put(key, data)
+    return data
+
+def synthesize_segment(sentence, lang, speed=1.0, engine=None):
+    """Sintetizar una oración usando la caché de segmentos"""
+    slow, factor = _speed_plan(speed)
+    return _with_fallback(sentence, lang, engine, lambda name: _segment(sentence, lang, slow, name, factor))
+
+def _sentences(text):
+    """Oraciones que se envían al motor; los fragmentos de solo puntuación se omiten"""
+    return [s for s in split_sentences(text) if is_speakable(s)] or [text]
+
+def _synthesize_segments(text, lang, slow, engine):
+    """Sintetizar solo las oraciones que faltan y unirlas a nivel de trama"""
+    sentences = _sentences(text)
+    return concat_mp3([_segment(s, lang, slow, engine) for s in sentences])
+
+def _synthesize_uncached(key, text, lang, slow, engine, factor=None, post=None):
+    """Sintetizar y cachear el texto una sola vez aunque lleguen peticiones idénticas
+
+    Cada variante parte de la anterior, también cacheada: posprocesado sobre
+    el audio a su velocidad, y velocidad sobre el audio original.
+    """
+    def run():
+        if post:
+            data = postprocess.process(_cached_text(text, lang, slow, engine, factor), post)
+        elif factor is not None:
+            data = time_stretch.change_speed(_cached_text(text, lang, slow, engine), factor)
+        else:
+            data = _synthesize_segments(text, lang, slow, engine)
+        audio_cache.put(key, data)
+        return data
+    return _text_flights.do(key, run)
+
+def _cached_text(text, lang, slow, engine, factor=None, post=None):
+    key = _variant_key(text, lang, slow, engine, factor, post)
+    data = audio_cache.get_bytes(key)
+    if data is None:
+        data = _synthesize_uncached(key, text, lang, slow, engine, factor, post)
+    return data
+
+def synthesize(text, lang, speed=1.0, engine=None):
+    """Sintetizar texto a MP3 usando la caché antes de llamar al motor"""
+    slow, factor = _speed_plan(speed)
+    return _with_fallback(text, lang, engine, lambda name: _cached_text(text, lang, slow, name, factor))
+
+def _stream_segment(sentence, lang, slow, engine):
+    """Emitir el audio de una oración desde la caché o desde el motor"""
+    key = make_key(sentence, lang, slow, engine)
+    data = segment_cache.get_bytes(key)
+    if data is not None:
+        yield data
+        return
+
+    call, leader = _segment_flights.begin(key)
+    if not leader:
+        # Otra petición ya sintetiza esta oración: reutilizar su resultado
+        data = call.wait()
+        yield data if not call.abandoned else _segment(sentence, lang, slow, engine)
+        return
+
+    parts = []
+    try:
+        for chunk in _fetch_stream(sentence, lang, slow, engine):
+            parts.append(chunk)
+            yield chunk
+    except Exception as e:
+        _segment_flights.finish(key, call, error=e)
+        raise
+    except BaseException:
+        # Cliente desconectado: quien espere sintetiza por su cuenta
+        _segment_flights.abandon(key, call)
+        raise
+    data = b''.join(parts)
+    segment_cache.put(key, data)
+    _segment_flights.finish(key, call, result=data)
+
+def _stream_text(text, lang, slow, engine, chunk_size, factor=None, post=None):
+    key = _variant_key(text, lang, slow, engine, factor, post)
+    cached_path = audio_cache.get(key)
+    if cached_path is not None:
+        with open(cached_path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    if factor is not None or post:
+        # Velocidad y posprocesado necesitan el audio completo: se emite al terminar
+        data = _synthesize_uncached(key, text, lang, slow, engine, factor, post)
+        for offset in range(0, len(data), chunk_size):
+            yield data[offset:offset + chunk_size]
+        return
+
+    sentences = _sentences(text)
+    parts = []
+    for sentence in sentences:
+        for chunk in _stream_segment(sentence, lang, slow, engine):
+            # Igual que concat_mp3: solo tramas de audio, sin etiquetas
+            if len(sentences) > 1:
+                chunk = b''.join(iter_frames(chunk))
+            parts.append(chunk)
+            yield chunk
+    audio_cache.put(key, b''.join(parts))
+
+def synthesize_stream(text, lang, speed=1.0, chunk_size=64 * 1024, engine=None, post=None):
+    """Sintetizar texto emitiendo bytes MP3 a medida que se producen
+
+    El motor de respaldo solo entra si el principal falla antes de emitir
+    el primer fragmento.
+    """
+    slow, factor = _speed_plan(speed)
+    names = route(text, lang, engine)
+    for i, name in enumerate(names):
+        started = False
+        try:
+            for chunk in _stream_text(text, lang, slow, name, chunk_size, factor, post):
+                started = True
+                yield chunk
+            return
+        except Exception as e:
+            if started or i == len(names) - 1:
+                raise
+            print(f"⚠️ Motor '{name}' falló ({e}); usando '{names[i + 1]}'")
+
+def synthesize_to_file(text, lang, filepath, speed=1.0, engine=None, post=None):
+    """Sintetizar texto y copiar el MP3 desde la caché a filepath
+
+    post son las opciones validadas por postprocess.parse_options.
+    """
+    slow, factor = _speed_plan(speed)
+
+    def run(name):
+        key = _variant_key(text, lang, slow, name, factor, post)
+        cached_path = audio_cache.get(key)
+        if cached_path is not None:
+            with stage('save'):
+                return storage.atomic_copy(cached_path, filepath)
+
+        data = _synthesize_uncached(key, text, lang, slow, name, factor, post)
+        with stage('save'):
+            return storage.atomic_write(filepath, data)
+    return _with_fallback(text, lang, engine, run)
+
+def submit_batch(texts, lang, speed=1.0, engine=None):
+    """Encolar la síntesis de varios textos y devolver sus futures en orden
+
+    Los textos repetidos (tras normalizar) comparten el mismo future, así que
+    cada texto distinto se sintetiza una sola vez.
+    """
+    executor = get_executor()
+    futures = {}
+    result = []
+    for text in texts:
+        key = make_key(text, lang, speed)
+        if key not in futures:
+            futures[key] = executor.submit(synthesize, text, lang, speed, engine)
+        result.append(futures[key])
+    return result
+
+def synthesize_batch_events(texts, lang, speed=1.0, engine=None):
+    """Sintetizar un lote emitiendo un evento por elemento a medida que avanza
+
+    Primero un evento 'queued' por texto y después, en orden de finalización,
+    'synthesized' (con los bytes en 'data') o 'failed'. Cada evento lleva el
+    índice del texto en la lista y los tiempos en ms: espera en la cola,
+    síntesis y transcurrido desde el inicio del lote. Los textos repetidos
+    comparten síntesis y producen un evento por posición.
+    """
+    executor = get_executor()
+    start = time.perf_counter()
+    timings = {}  # clave -> (inicio, fin) de la síntesis
+
+    def run(key, text):
+        started = time.perf_counter()
+        try:
+            return synthesize(text, lang, speed, engine)
+        finally:
+            timings[key] = (started, time.perf_counter())
+
+    def ms(seconds):
+        return round(seconds * 1000, 3)
+
+    futures = {}
+    positions = {}  # future -> [(índice, clave)]
+    for index, text in enumerate(texts):
+        key = make_key(text, lang, speed)
+        if key not in futures:
+            futures[key] = executor.submit(run, key, text)
+        positions.setdefault(futures[key], []).append((index, key))
+        yield {'event': 'queued', 'index': index, 'elapsed_ms': ms(time.perf_counter() - start)}
+
+    try:
+        for future in as_completed(positions):
+            error = future.exception()
+            for index, key in positions[future]:
+                started, finished = timings[key]
+                event = {
+                    'event': 'failed' if error else 'synthesized',
+                    'index': index,
+                    'queue_ms': ms(started - start),
+                    'synthesis_ms': ms(finished - started),
+                    'elapsed_ms': ms(time.perf_counter() - start)
+                }
+                if error:
+                    event['error'] = str(error)
+                else:
+                    event['data'] = future.result()
+                    event['bytes'] = len(event['data'])
+                yield event
+    finally:
+        # Cliente desconectado: no sintetizar lo que aún no ha empezado
+        for future in positions:
+            future.cancel()
+
+def synthesize_batch(texts, lang, speed=1.0, engine=None):
+    """Sintetizar varios textos en paralelo
+
+    Devuelve una lista de tuplas (datos, error) en el orden original; un fallo
+    en un elemento no interrumpe el resto del lote.
+    """
+    results = []
+    for future in submit_batch(texts, lang, speed, engine):
+        try:
+            results.append((future.result(), None))
+        except Exception as e:
+            results.append((None, e))
+    return results
+
+def synthesize_document(input_path, lang, output_path, speed=1.0, on_progress=None, engine=None):
+    """Sintetizar un documento largo escribiendo el MP3 de forma incremental
+
+    El texto se lee por bloques y solo se mantiene en memoria una ventana
+    acotada de oraciones en vuelo, sea cual sea el tamaño del documento.
+    """
+    executor = get_executor()
+    window = deque()
+    max_in_flight = BATCH_WORKERS * 2
+    total_bytes = max(os.path.getsize(input_path), 1)
+
+    def write_oldest(out):
+        future, position = window.popleft()
+        for frame in iter_frames(future.result()):
+            out.write(frame)
+        if on_progress:
+            on_progress(min(position / total_bytes, 1.0))
+
+    try:
+        # newline='' conserva los \r\n para que los bytes consumidos cuadren con el tamaño
+        with open(input_path, 'r', encoding='utf-8', errors='replace', newline='') as src, \
+                storage.atomic_open(output_path) as out:
+            for sentence, consumed in iter_sentences(src):
+                window.append((executor.submit(synthesize_segment, sentence, lang, speed, engine), consumed))
+                if len(window) >= max_in_flight:
+                    write_oldest(out)
+            while window:
+                write_oldest(out)
+    except BaseException:
+        for future, _ in window:
+            future.cancel()
+        raise
+    return output_path
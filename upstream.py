@@ -0,0 +1,183 @@
+import os
+import re
+import time
+import base64
+import random
+import threading
+import metrics
+
+# requests y gTTS se importan al crear la sesión y en la primera síntesis,
+# no al arrancar el proceso
+
+# URL base alternativa (p. ej. un doble local del servicio TTS para pruebas)
+UPSTREAM_URL = os.environ.get('TTS_UPSTREAM_URL')
+UPSTREAM_POOL_SIZE = int(os.environ.get('TTS_UPSTREAM_POOL', 8))
+UPSTREAM_TIMEOUT = float(os.environ.get('TTS_UPSTREAM_TIMEOUT', 10))
+UPSTREAM_MAX_RETRIES = int(os.environ.get('TTS_UPSTREAM_RETRIES', 3))
+BREAKER_FAILURES = int(os.environ.get('TTS_BREAKER_FAILURES', 5))
+BREAKER_RESET = float(os.environ.get('TTS_BREAKER_RESET', 30))
+
+# Respuestas que indican un problema transitorio del servicio remoto
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+_AUDIO_RE = re.compile(r'jQ1olc","\[\\"(.*)\\"]')
+
+UPSTREAM_RETRIES = metrics.registry.register(metrics.Counter(
+    'tts_upstream_retries_total', 'Reintentos de peticiones al servicio TTS'))
+UPSTREAM_FAILURES = metrics.registry.register(metrics.Counter(
+    'tts_upstream_failures_total', 'Peticiones fallidas al servicio TTS', ('reason',)))
+BREAKER_STATE = metrics.registry.register(metrics.Gauge(
+    'tts_upstream_circuit_open', 'Circuito hacia el servicio TTS abierto (1) o cerrado (0)'))
+
+class UpstreamError(Exception):
+    """Fallo definitivo al consultar el servicio TTS"""
+
+class UpstreamUnavailable(UpstreamError):
+    """Circuito abierto: el servicio TTS se considera caído temporalmente"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after + 0.5))
+
+class CircuitBreaker:
+    """Cortocircuito con estados cerrado, abierto y semiabierto"""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half_open'
+            return 'open'
+
+    def allow(self):
+        """Permitir la petición o lanzar UpstreamUnavailable sin tocar la red"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            # Tras el tiempo de espera se deja pasar una única petición de prueba
+            if remaining <= 0 and not self._probing:
+                self._probing = True
+                return
+            raise UpstreamUnavailable("Servicio TTS no disponible temporalmente", max(remaining, 1))
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+        BREAKER_STATE.set(0)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._probing = False
+                BREAKER_STATE.set(1)
+
+class UpstreamClient:
+    """Cliente compartido del servicio TTS: conexiones persistentes, reintentos y cortocircuito
+
+    gTTS solo se usa para tokenizar el texto y preparar las peticiones; el envío
+    se hace por una sesión de requests reutilizada para evitar un handshake TLS
+    por llamada.
+    """
+
+    def __init__(self, base_url=UPSTREAM_URL, pool_size=UPSTREAM_POOL_SIZE, timeout=UPSTREAM_TIMEOUT,
+                 max_retries=UPSTREAM_MAX_RETRIES, backoff_base=0.2, backoff_max=5.0, breaker=None):
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._session = None
+        self._session_pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        # Una sesión por proceso: las conexiones no se comparten tras un fork
+        with self._lock:
+            if self._session is None or self._session_pid != os.getpid():
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session = session
+                self._session_pid = os.getpid()
+            return self._session
+
+    def _backoff(self, attempt):
+        """Espera exponencial con jitter completo"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _rewrite(self, prepared):
+        if self.base_url:
+            path = prepared.url.split('/', 3)[3]
+            prepared.url = f"{self.base_url}/{path}"
+        return prepared
+
+    def _send(self, prepared):
+        """Enviar una petición con reintentos acotados"""
+        import requests
+        for attempt in range(self.max_retries + 1):
+            self.breaker.allow()
+            try:
+                response = self.session.send(prepared, timeout=self.timeout)
+                if response.status_code in RETRY_STATUSES:
+                    raise UpstreamError(f"Respuesta {response.status_code} del servicio TTS")
+            except (requests.ConnectionError, requests.Timeout, UpstreamError) as e:
+                self.breaker.record_failure()
+                UPSTREAM_FAILURES.inc(reason=type(e).__name__)
+                if attempt >= self.max_retries:
+                    raise UpstreamError(f"Servicio TTS no disponible: {e}") from e
+                UPSTREAM_RETRIES.inc()
+                time.sleep(self._backoff(attempt))
+                continue
+            except requests.RequestException as e:
+                # Fallo no transitorio (redirecciones en bucle, URL inválida...):
+                # sin reintento, pero cuenta como fallo y libera la prueba semiabierta
+                self.breaker.record_failure()
+                UPSTREAM_FAILURES.inc(reason=type(e).__name__)
+                raise UpstreamError(f"Error en la petición al servicio TTS: {e}") from e
+            except BaseException:
+                # Cualquier otra excepción tampoco puede dejar el circuito bloqueado
+                self.breaker.record_failure()
+                raise
+
+            # El servicio respondió: un error del cliente no indica que esté caído
+            self.breaker.record_success()
+            if response.status_code >= 400:
+                raise UpstreamError(f"Respuesta {response.status_code} del servicio TTS")
+            return response
+
+    def stream(self, text, lang, slow=False):
+        """Emitir los bytes MP3 de cada fragmento del texto a medida que llegan"""
+        from gtts import gTTS
+        tts = gTTS(text=text, lang=lang, slow=slow)
+        for prepared in tts._prepare_requests():
+            response = self._send(self._rewrite(prepared))
+            found = False
+            for line in response.iter_lines(chunk_size=1024):
+                match = _AUDIO_RE.search(line.decode('utf-8'))
+                if match:
+                    found = True
+                    yield base64.b64decode(match.group(1).encode('ascii'))
+            if not found:
+                raise UpstreamError("Respuesta del servicio TTS sin audio")
+
+upstream_client = UpstreamClient()
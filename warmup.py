@@ -0,0 +1,133 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import db
+from tts_service import CACHE_FOLDER, synthesize
+from upstream import UpstreamUnavailable
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+# Precalentamiento de la caché al arrancar (plantillas + textos frecuentes)
+WARMUP_ENABLED = os.environ.get('TTS_WARMUP', '1').lower() in ('1', 'true')
+WARMUP_TOP_N = int(os.environ.get('TTS_WARMUP_TOP_N', 20))
+WARMUP_WORKERS = int(os.environ.get('TTS_WARMUP_WORKERS', 2))
+# Idiomas de las plantillas ("es,en"); vacío = todos los soportados
+WARMUP_LANGS = [lang for lang in os.environ.get('TTS_WARMUP_LANGS', '').replace(' ', '').split(',') if lang]
+
+class CacheWarmer:
+    """Sintetiza en segundo plano los textos que se pedirán tras un despliegue
+
+    Las plantillas se preparan en cada idioma y, después, los textos más
+    frecuentes del historial. No bloquea el arranque: las peticiones se
+    atienden mientras tanto y las que coincidan con un texto en curso se
+    unen a esa misma síntesis. Si el circuito del servicio TTS se abre, el
+    calentamiento se detiene sin insistir.
+    """
+
+    def __init__(self, templates, languages, top_n=WARMUP_TOP_N, workers=WARMUP_WORKERS):
+        self.templates = list(templates)
+        self.languages = [lang for lang in languages if not WARMUP_LANGS or lang in WARMUP_LANGS]
+        self.top_n = top_n
+        self.workers = max(1, workers)
+        self.status = 'idle'
+        self.done = 0
+        self.failed = 0
+        self.total = 0
+        self.elapsed = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock_file = None
+
+    def _acquire_process_lock(self):
+        """Solo un proceso trabajador calienta la caché compartida
+
+        El bloqueo se mantiene mientras viva el proceso, así que los
+        trabajadores que arrancan después tampoco repiten el trabajo.
+        """
+        if fcntl is None:
+            return True
+        os.makedirs(CACHE_FOLDER, exist_ok=True)
+        lock_file = open(os.path.join(CACHE_FOLDER, 'warmup.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def items(self):
+        """Lista ordenada y sin duplicados de pares (texto, idioma)"""
+        items = [(text, lang) for text in self.templates for lang in self.languages]
+        if self.top_n:
+            try:
+                items += [(row[0], row[1]) for row in db.frequent_texts(self.top_n)]
+            except Exception as e:
+                print(f"⚠️ Calentamiento sin historial: {e}")
+        return list(dict.fromkeys(items))
+
+    def _warm(self, item):
+        if self._stop.is_set():
+            return
+        text, lang = item
+        try:
+            synthesize(text, lang)
+            with self._lock:
+                self.done += 1
+        except UpstreamUnavailable:
+            # Circuito abierto: no tiene sentido seguir llamando al servicio
+            self._stop.set()
+            with self._lock:
+                self.failed += 1
+        except Exception as e:
+            print(f"⚠️ Calentamiento fallido ({lang}): {e}")
+            with self._lock:
+                self.failed += 1
+
+    def run_once(self):
+        """Calentar la caché y devolver el número de textos preparados"""
+        start = time.monotonic()
+        items = self.items()
+        with self._lock:
+            self.status = 'running'
+            self.total = len(items)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='cache-warmup') as pool:
+            list(pool.map(self._warm, items))
+        with self._lock:
+            self.status = 'stopped' if self._stop.is_set() else 'done'
+            self.elapsed = round(time.monotonic() - start, 2)
+        print(f"🔥 Caché precalentada: {self.done}/{self.total} textos en {self.elapsed}s")
+        return self.done
+
+    def _run(self):
+        if not self._acquire_process_lock():
+            self.status = 'skipped'
+            return
+        try:
+            self.run_once()
+        except Exception as e:
+            self.status = 'error'
+            print(f"Error en el calentamiento de caché: {e}")
+
+    def start(self):
+        """Arrancar el calentamiento en segundo plano (una sola vez)"""
+        if not WARMUP_ENABLED:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='cache-warmup', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            return {'status': self.status, 'done': self.done, 'failed': self.failed,
+                    'total': self.total, 'elapsed': self.elapsed}
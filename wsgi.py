@@ -11,16 +11,14 @@ project_dir = os.path.dirname(__file__)
 if project_dir not in sys.path:
     sys.path.insert(0, project_dir)
 
-# Importar la aplicación
+# Importar la fábrica de la API Flask (main.py es la aplicación Streamlit)
 try:
-    from main import app
+    from main_flask import create_app
     
-    # Configurar para entorno de producción
-    app.config.update(
-        SECRET_KEY=os.environ.get('SECRET_KEY', 'fallback-secret-key'),
-        DEBUG=False,
-        TESTING=False
-    )
+    # Configurar para entorno de producción (FLASK_CONFIG permite cambiarlo)
+    app = create_app(os.environ.get('FLASK_CONFIG', 'production'))
+    if not app.config.get('SECRET_KEY'):
+        app.config['SECRET_KEY'] = 'fallback-secret-key'
     
     # Aplicación WSGI
     application = app
@@ -32,4 +30,4 @@ except ImportError as e:
 if __name__ == "__main__":
     # Solo para testing directo del wsgi
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=False)
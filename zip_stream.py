@@ -0,0 +1,45 @@
+import zipfile
+from metrics import stage
+
+class _StreamSink:
+    """Destino de escritura no posicionable que acumula bytes en memoria"""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Devolver y descartar los bytes acumulados desde la última llamada"""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def stream_zip(entries):
+    """Generar un ZIP por fragmentos a partir de tuplas (nombre, bytes)
+
+    Cada entrada se emite en cuanto se recibe, sin archivos temporales: al no
+    poder reposicionarse, zipfile escribe descriptores de datos tras cada entrada.
+    """
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, 'w') as zip_file:
+        for name, data in entries:
+            with stage('zip'):
+                zip_file.writestr(name, data)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    # Directorio central
+    chunk = sink.drain()
+    if chunk:
+        yield chunk